@@ -1,16 +1,39 @@
 from PySide6.QtWidgets import (QMainWindow, QLabel, QWidget, QGridLayout,
                                QComboBox, QPushButton, QDialog, QLineEdit, QDialogButtonBox, QColorDialog, QToolBar,
-                               QStatusBar, QTabWidget, QMessageBox)
-from PySide6.QtCore import QSize, QTimer, Qt, QThread
-from PySide6.QtGui import QFont, QIcon, QIntValidator, QColor, QPainter, QAction
-from PySide6.QtCharts import QChart, QLineSeries, QChartView, QValueAxis
+                               QStatusBar, QTabWidget, QMessageBox, QCheckBox, QFileDialog, QSlider,
+                               QPlainTextEdit)
+from PySide6.QtCore import QSize, QTimer, Qt, QThread, Signal, QRect, QPointF
+from PySide6.QtGui import QFont, QIcon, QIntValidator, QDoubleValidator, QColor, QPainter, QAction, QImage, QPen
 
 import serial.tools.list_ports
+import collections
 import configparser
 
+import io
 import os
-import xlwings as xw
 import datetime
+import multiprocessing
+import time
+import numpy as np
+
+from frameParser import binarySampleTypes
+from colorMap import ColorLut, gradientPresets
+from recorder import Recorder, recordingSinks
+from sessionFile import SessionReader
+from chartData import FrameHistory, SlidingMinMax, Decimator, decimationList
+from simulatedSerial import SimulatedSerial, simulatorPort, waveformList
+from multiPort import MultiPortAcquisition, multiPortName, parsePortRegions, formatPortRegions
+from metrics import metrics
+from frameQueue import FrameQueue, queuePolicies
+from rollingStats import RollingStats, layerList
+from serialTransport import (loadSerialSettings, saveSerialSettings, portSettings, createSerial, openSerial,
+                             pyserialSettings, lineRate, baudRateList, byteSizeList, parityList, stopBitsList)
+from frameBus import FrameBus, BusReader
+from headless import publishToBus, recordFromBus
+from framePublisher import FramePublisher, publisherPolicies
+from alarmEngine import AlarmEngine, parseAlarmRules, formatAlarmRules, checkAlarmRules
+from roi import RoiAggregator, RoiSink, parseRois, formatRois
+from acquisitionSetup import AcquisitionSetup, setRecorderMetrics
 
 config = configparser.ConfigParser()
 config.read('config.ini')
@@ -19,19 +42,63 @@ config.read('config.ini')
 numBlock = int(config.get('Display', 'numBlock'))
 blockRow = int(config.get('Display', 'blockRow'))
 blockColumn = int(config.get('Display', 'blockColumn'))
-previousBlockRow = blockRow
-previousBlockColumn = blockColumn
 separationBetweenRows = int(config.get('Data', 'separation_between_rows'))
 separationBetweenNumbers = int(config.get('Data', 'separation_between_numbers'))
+protocol = config.get('Data', 'protocol', fallback='ascii')
+recordFormat = config.get('Data', 'record_format', fallback='csv')
+# What the recorder does once frameBufferLength frames are waiting to be written, see FrameQueue
+recordPolicy = config.get('Data', 'record_policy', fallback='dropOldest')
+syncInterval = float(config.get('Data', 'sync_interval', fallback='1'))
+binarySampleType = config.get('Data', 'binary_sample_type', fallback='int16')
 numBlockChanged = False
+# The chart histories only have to be rebuilt when their length or the ROIs changed
+historyChanged = False
 maxDataNum = int(config.get('Data', 'maxData'))
 minDataNum = int(config.get('Data', 'minData'))
 timeInterval = int(config.get('Data', 'timeinterval'))
 timeIntervalChanged = False
+showNumbers = config.get('Display', 'show_numbers', fallback='True') == 'True'
+# Layer shown by the heatmap, statsWindow frames for the rolling layers and emaAlpha for the EMA
+layer = config.get('Display', 'layer', fallback='raw')
+statsWindow = int(config.get('Display', 'stats_window', fallback='100'))
+emaAlpha = float(config.get('Display', 'ema_alpha', fallback='0.1'))
 xAxisLength = int(config.get('Graph', 'xAxisLength'))
-xCount = 0
+decimation = config.get('Graph', 'decimation', fallback='minmax')
+frameBufferLength = int(config.get('Data', 'frame_buffer_length', fallback='10000'))
+# Line charts push new points to their series at most this often (ms)
+chartRefreshInterval = 50
+# Closed line chart windows kept around to be reused instead of building a new one
+chartPoolSize = 4
 language = config.get('General', 'language')
-firstRead = True
+simulatorFrameRate = float(config.get('Simulator', 'frame_rate', fallback='100'))
+simulatorWaveform = config.get('Simulator', 'waveform', fallback='sine')
+simulatorNoise = float(config.get('Simulator', 'noise', fallback='0'))
+simulatorCorruption = float(config.get('Simulator', 'corruption', fallback='0'))
+# Ports read together, each filling a region of the grid: [(port, row, column, rows, columns), ...]
+portRegions = parsePortRegions(config.get('Ports', 'regions', fallback=''))
+portMaxSkew = float(config.get('Ports', 'max_skew', fallback='0.05'))
+portRegionsChanged = False
+# Baud rate, framing, timeout and receive buffer, for every port and per port, see serialTransport
+serialSettings = loadSerialSettings(config)
+# Ports are read and frames recorded in processes of their own that hand frames over through a FrameBus of
+# busCapacity frames, so a busy GUI cannot hold back reading or recording
+busEnabled = config.get('Bus', 'enabled', fallback='False') == 'True'
+busCapacity = int(config.get('Bus', 'capacity', fallback='1024'))
+# Every frame shown is also streamed to TCP subscribers on publisherAddress (host:port), each with a buffer of
+# publisherQueueLength frames handled by publisherPolicy when it is full, see framePublisher
+publisherEnabled = config.get('Publisher', 'enabled', fallback='False') == 'True'
+publisherAddress = config.get('Publisher', 'address', fallback='127.0.0.1:5555')
+publisherQueueLength = int(config.get('Publisher', 'queue_length', fallback='64'))
+publisherPolicy = config.get('Publisher', 'policy', fallback='dropOldest')
+# Threshold, rate and duration rules checked on every frame, see alarmEngine. Raised and cleared alarms are
+# appended to alarmLogPath and the cells in alarm are outlined on the grid
+alarmRules = parseAlarmRules(config.get('Alarms', 'rules', fallback=''))
+alarmLogPath = config.get('Alarms', 'log', fallback='data/alarms.csv')
+# Named regions of cells, see roi. Their sums, means, maxima and centroids are charted and recorded beside the frames
+rois = parseRois(config.get('ROI', 'regions', fallback=''))
+# Metrics are written to this file every metricsDumpInterval seconds, Prometheus text for .prom, JSON otherwise
+metricsPath = config.get('Metrics', 'path', fallback='')
+metricsDumpInterval = float(config.get('Metrics', 'dump_interval', fallback='10'))
 startReading = False
 currentSerial = serial.Serial()
 currentSerial.close()
@@ -42,13 +109,32 @@ portList = []
 colorData = [[255, 255, 255] for _ in range(numBlock)]
 totalData = [(maxDataNum + minDataNum) // 2 for _ in range(numBlock)]
 languageList = [['English', 'en'], ['简体中文', 'zh_CN']]
+protocolList = [['ASCII', 'ascii'], ['Binary', 'binary']]
+# 0 replays as fast as possible
+replaySpeedList = [['0.1x', 0.1], ['0.5x', 0.5], ['1x', 1], ['2x', 2], ['5x', 5], ['10x', 10], ['Max', 0]]
+recordFormatList = [['CSV', 'csv'], ['Binary', 'binary'], ['Session', 'session']]
 startColor = list(map(int, config.get('Color', 'startColor').split()))
 endColor = list(map(int, config.get('Color', 'endColor').split()))
 intervalColor = list(map(int, config.get('Color', 'intervalColor').split()))
-activeLineChart = [False for _ in range(numBlock)]
-
-totalDataList = []
-totalTimeList = []
+gradient = config.get('Color', 'gradient', fallback='Custom')
+# Recent frames of all blocks, the line charts only read from it
+history = FrameHistory(xAxisLength + 1, numBlock)
+# Aggregates of the ROIs that fit the grid and their recent history, one column per ROI and aggregate, see
+# MainWindow.updateRois
+roiAggregator = None
+roiHistory = FrameHistory(xAxisLength + 1, 0)
+
+# Writes the frames read by SerialReadingThread, only exists while reading
+recorder = None
+# Latest frame for the display, a frame the display had no time to show is replaced by the next one
+displayQueue = FrameQueue(1, 'coalesce')
+# Derived layers of every frame, updated by the reader
+rollingStats = RollingStats(numBlock, statsWindow, emaAlpha)
+# Checks the alarm rules while reading, only exists while reading with alarm rules set
+alarmEngine = None
+# Only exists while publisherEnabled, publisherSettings are the settings it was started with
+publisher = None
+publisherSettings = None
 startTime = ''
 
 
@@ -61,29 +147,171 @@ def getPortList():
         nameList.append(str(portList[i]))
         portList[i] = str(portList[i]).split(' - ')[0]
 
+    portList.append(simulatorPort)
+    nameList.append(f'{simulatorPort} - Simulated device')
+    if portRegions:
+        portList.append(multiPortName)
+        nameList.append(f'{multiPortName} - {len(portRegions)} ports merged')
+
+
+def acquisitionSetup():
+    # Ports and parsers with the current settings, built again every time reading starts
+    return AcquisitionSetup(protocol, binarySampleType, separationBetweenRows, separationBetweenNumbers, serialSettings,
+                            (simulatorFrameRate, simulatorWaveform, simulatorNoise, simulatorCorruption), minDataNum,
+                            maxDataNum)
+
+
+def createAcquisition():
+    setup = acquisitionSetup()
+    return MultiPortAcquisition(portRegions, blockRow, blockColumn, setup.createPort, setup.createParser,
+                                publishFrame, portMaxSkew, setup.openPort)
+
+
+def publishFrame(currentTime, currentTotalData):
+    # Every acquired frame goes to the recorder, the chart history and the display
+    recorder.put(currentTime, currentTotalData)
+    displayFrame(currentTime, currentTotalData)
+
+
+def displayFrame(currentTime, currentTotalData, checkAlarms=True):
+    # Replayed frames were checked when they were recorded and are shown with checkAlarms False
+    metrics.increment('framesPublished')
+    if publisher is not None:
+        publisher.publish(currentTime, currentTotalData)
+    if checkAlarms and alarmEngine is not None:
+        alarmEngine.put(currentTime, currentTotalData)
+    history.append(currentTime, currentTotalData)
+    if roiAggregator is not None:
+        roiHistory.append(currentTime, roiAggregator.aggregate(currentTotalData).ravel())
+    rollingStats.update(currentTotalData)
+    displayQueue.put(currentTotalData)
+
+
+def updatePublisher():
+    # Starts, restarts or stops the publisher after the settings or the grid changed
+    global publisher, publisherSettings
+    settings = (publisherAddress, publisherQueueLength, publisherPolicy, numBlock)
+    if publisher is not None and (not publisherEnabled or settings != publisherSettings):
+        publisher.stop()
+        publisher = None
+        print('Publisher is stopped.')
+    if publisherEnabled and publisher is None:
+        host, port = publisherAddress.rsplit(':', 1)
+        publisher = FramePublisher(numBlock, host, int(port), publisherQueueLength, publisherPolicy)
+        publisherSettings = settings
+        publisher.start()
+        print(f'Publishing frames on {publisherAddress}.')
+
+
+def createAlarmEngine():
+    if os.path.dirname(alarmLogPath):
+        os.makedirs(os.path.dirname(alarmLogPath), exist_ok=True)
+    return AlarmEngine(alarmRules, blockRow, blockColumn, alarmLogPath, frameBufferLength)
+
+
+def buildColorLut():
+    global colorLut
+    if gradient in gradientPresets:
+        colorLut = ColorLut(gradientPresets[gradient], minDataNum, maxDataNum)
+    else:
+        colorLut = ColorLut([startColor, intervalColor, endColor], minDataNum, maxDataNum)
+
 
-def getColor(num):
-    if num > maxDataNum:
-        num = maxDataNum
-    elif num < minDataNum:
-        num = minDataNum
-
-    middle = (maxDataNum + minDataNum) / 2
-    if num < middle:
-        interval = (num - minDataNum) / (middle - minDataNum)
-        return interpolateColor(startColor, intervalColor, interval)
-    elif num > middle:
-        interval = (num - middle) / (maxDataNum - middle)
-        return interpolateColor(intervalColor, endColor, interval)
+def createRecorder():
+    if 'data' not in os.listdir():
+        os.mkdir('data')
+    sink = recordingSinks[recordFormat]
+    path = f'data/totalData {startTime}.{sink.extension}'
+    if recordFormat == 'session':
+        sink = sink(path, numBlock, sessionHeader())
     else:
-        return intervalColor
+        sink = sink(path, numBlock)
+    sinks = [sink]
+    if roiAggregator is not None:
+        sinks.append(RoiSink(f'data/totalData {startTime}.{RoiSink.extension}', roiAggregator))
+    return Recorder(sinks, syncInterval, frameBufferLength, recordPolicy)
+
+
+def sessionHeader():
+    return {'startTime': startTime, 'blockRow': blockRow, 'blockColumn': blockColumn, 'maxData': maxDataNum,
+            'minData': minDataNum, 'startColor': startColor, 'intervalColor': intervalColor, 'endColor': endColor,
+            'gradient': gradient}
+
+
+def updateConfig():
+    # Current settings into config, written to config.ini on exit and handed to the acquisition processes
+    config.set('Data', 'maxData', str(maxDataNum))
+    config.set('Data', 'minData', str(minDataNum))
+    config.set('Data', 'timeinterval', str(timeInterval))
+    config.set('Data', 'separation_between_rows', str(separationBetweenRows))
+    config.set('Data', 'separation_between_numbers', str(separationBetweenNumbers))
+    config.set('Data', 'frame_buffer_length', str(frameBufferLength))
+    config.set('Data', 'protocol', protocol)
+    config.set('Data', 'record_format', recordFormat)
+    config.set('Data', 'record_policy', recordPolicy)
+    config.set('Data', 'sync_interval', str(syncInterval))
+    config.set('Data', 'binary_sample_type', binarySampleType)
+    config.set('Display', 'numBlock', str(numBlock))
+    config.set('Display', 'blockRow', str(blockRow))
+    config.set('Display', 'blockColumn', str(blockColumn))
+    config.set('Display', 'show_numbers', str(showNumbers))
+    config.set('Display', 'layer', layer)
+    config.set('Display', 'stats_window', str(statsWindow))
+    config.set('Display', 'ema_alpha', str(emaAlpha))
+    config.set('Color', 'startColor', ' '.join([str(i) for i in startColor]))
+    config.set('Color', 'endColor', ' '.join([str(i) for i in endColor]))
+    config.set('Color', 'intervalColor', ' '.join([str(i) for i in intervalColor]))
+    config.set('Color', 'gradient', gradient)
+    config.set('Graph', 'xAxisLength', str(xAxisLength))
+    config.set('Graph', 'decimation', decimation)
+    config.set('General', 'language', language)
+    if not config.has_section('Simulator'):
+        config.add_section('Simulator')
+    config.set('Simulator', 'frame_rate', str(simulatorFrameRate))
+    config.set('Simulator', 'waveform', simulatorWaveform)
+    config.set('Simulator', 'noise', str(simulatorNoise))
+    config.set('Simulator', 'corruption', str(simulatorCorruption))
+    if not config.has_section('Ports'):
+        config.add_section('Ports')
+    config.set('Ports', 'regions', formatPortRegions(portRegions))
+    config.set('Ports', 'max_skew', str(portMaxSkew))
+    if not config.has_section('Metrics'):
+        config.add_section('Metrics')
+    config.set('Metrics', 'path', metricsPath)
+    config.set('Metrics', 'dump_interval', str(metricsDumpInterval))
+    if not config.has_section('Bus'):
+        config.add_section('Bus')
+    config.set('Bus', 'enabled', str(busEnabled))
+    config.set('Bus', 'capacity', str(busCapacity))
+    if not config.has_section('Publisher'):
+        config.add_section('Publisher')
+    config.set('Publisher', 'enabled', str(publisherEnabled))
+    config.set('Publisher', 'address', publisherAddress)
+    config.set('Publisher', 'queue_length', str(publisherQueueLength))
+    config.set('Publisher', 'policy', publisherPolicy)
+    if not config.has_section('Alarms'):
+        config.add_section('Alarms')
+    config.set('Alarms', 'rules', formatAlarmRules(alarmRules))
+    config.set('Alarms', 'log', alarmLogPath)
+    if not config.has_section('ROI'):
+        config.add_section('ROI')
+    config.set('ROI', 'regions', formatRois(rois))
+    saveSerialSettings(config, serialSettings)
+
+
+def configText():
+    updateConfig()
+    text = io.StringIO()
+    config.write(text)
+    return text.getvalue()
+
+
+def getColor(num):
+    # num can be a single value or a whole frame, the result is [r, g, b] or one row per value
+    return colorLut.map(num)
 
 
-def interpolateColor(start, end, interval):
-    r = int(start[0] * (1 - interval) + end[0] * interval)
-    g = int(start[1] * (1 - interval) + end[1] * interval)
-    b = int(start[2] * (1 - interval) + end[2] * interval)
-    return [r, g, b]
+buildColorLut()
 
 
 class MainWindow(QMainWindow):
@@ -91,7 +319,12 @@ class MainWindow(QMainWindow):
         super().__init__()
         # Variables
         self.currentSerialIndex = -1
-        self.dataCount = 0
+        self.acquisition = None
+        # Only while ports are read in a separate process, see startBus
+        self.bus = None
+        self.busReader = None
+        self.acquisitionProcess = None
+        self.recordingProcess = None
 
         # Window
         self.setWindowTitle(self.tr('Show color'))
@@ -99,16 +332,28 @@ class MainWindow(QMainWindow):
 
         # Thread
         self.serialReadingThread = SerialReadingThread(self)
-        self.excelWritingThread = ExcelWritingThread(self)
+        self.serialReadingThread.errorOccurred.connect(self.serialReadingError)
+        self.replayThread = ReplayThread(self)
+        self.replayThread.errorOccurred.connect(self.serialReadingError)
+        self.replayThread.finished.connect(self.replayFinished)
 
         # Timer
         self.timer = QTimer()
         self.timer.setInterval(timeInterval)
+        self.portStatsTimer = QTimer()
+        self.portStatsTimer.setInterval(1000)
+        self.portStatsTimer.timeout.connect(self.showPortStats)
+        self.metricsTimer = QTimer()
+        self.metricsTimer.setInterval(1000)
+        self.metricsTimer.timeout.connect(self.updateMetrics)
+        self.lastMetricsClock = time.monotonic()
+        self.lastMetricsDump = time.monotonic()
+        self.lastPublishedCount = 0
+        self.lastReceivedCount = None
+        self.lastAlarmEventCount = 0
 
         # Widgets
-        # self.labels = [ColorLabel(_) for _ in range(numBlock)]
-
-        self.labelArray = [[ColorLabel(j * blockColumn + i) for i in range(blockColumn)] for j in range(blockRow)]
+        self.heatmap = HeatmapWidget()
 
         self.errorMessage = QMessageBox()
 
@@ -117,6 +362,10 @@ class MainWindow(QMainWindow):
         self.toolbar.setIconSize(QSize(24, 24))
         self.addToolBar(self.toolbar)
         self.setStatusBar(QStatusBar(self))
+        # Permanent so status tips do not hide it
+        self.metricsLabel = QLabel()
+        self.statusBar().addPermanentWidget(self.metricsLabel)
+        self.metricsDialog = None
 
         self.startButtonAction = QAction(QIcon('img/start.svg'), self.tr('Start'), self)
         self.startButtonAction.setStatusTip(self.tr('Start reading'))
@@ -129,6 +378,35 @@ class MainWindow(QMainWindow):
         self.serialChooser.setStatusTip(self.tr('Choose serial'))
         self.toolbar.addWidget(self.serialChooser)
 
+        self.openSessionAction = QAction(self.tr('Open session'), self)
+        self.openSessionAction.setStatusTip(self.tr('Replay a recorded session'))
+        self.openSessionAction.triggered.connect(self.openSession)
+        self.toolbar.addAction(self.openSessionAction)
+
+        self.toolbar.addSeparator()
+
+        self.layerChooser = QComboBox()
+        self.layerChooser.setStatusTip(self.tr('Value shown for each block'))
+        self.layerChooser.addItems(layerList)
+        self.layerChooser.setCurrentText(layer)
+        self.layerChooser.currentTextChanged.connect(self.layerChanged)
+        self.toolbar.addWidget(self.layerChooser)
+
+        self.baselineAction = QAction(self.tr('Baseline'), self)
+        self.baselineAction.setStatusTip(self.tr('Capture the current frame as the baseline of the delta layer'))
+        self.baselineAction.triggered.connect(self.captureBaseline)
+        self.toolbar.addAction(self.baselineAction)
+
+        self.resetPeakAction = QAction(self.tr('Reset peak'), self)
+        self.resetPeakAction.setStatusTip(self.tr('Restart the peak layer from the current frame'))
+        self.resetPeakAction.triggered.connect(self.resetPeak)
+        self.toolbar.addAction(self.resetPeakAction)
+
+        self.roiChooser = QComboBox()
+        self.roiChooser.setStatusTip(self.tr('Chart an aggregate of an ROI'))
+        self.roiChooser.activated.connect(self.openRoiChart)
+        self.roiChooserAction = self.toolbar.addWidget(self.roiChooser)
+
         self.toolbar.addSeparator()
 
         self.refreshButtonAction = QAction(QIcon('img/refresh.svg'), self.tr('Refresh'), self)
@@ -141,28 +419,39 @@ class MainWindow(QMainWindow):
         self.settingButtonAction.triggered.connect(self.settingButtonClicked)
         self.toolbar.addAction(self.settingButtonAction)
 
+        self.metricsAction = QAction(self.tr('Metrics'), self)
+        self.metricsAction.setStatusTip(self.tr('Show pipeline metrics'))
+        self.metricsAction.triggered.connect(self.showMetricsDialog)
+        self.toolbar.addAction(self.metricsAction)
+
+        # Replay toolbar, only shown while a session is chosen instead of a serial port
+        self.replayToolbar = QToolBar()
+        self.addToolBar(Qt.ToolBarArea.BottomToolBarArea, self.replayToolbar)
+
+        self.pauseAction = QAction(self.tr('Pause'), self)
+        self.pauseAction.setCheckable(True)
+        self.pauseAction.setStatusTip(self.tr('Pause replay'))
+        self.pauseAction.toggled.connect(self.pauseToggled)
+        self.replayToolbar.addAction(self.pauseAction)
+
+        self.replaySpeedChooser = QComboBox()
+        self.replaySpeedChooser.setStatusTip(self.tr('Replay speed'))
+        for _ in range(len(replaySpeedList)):
+            self.replaySpeedChooser.addItem(replaySpeedList[_][0], replaySpeedList[_][1])
+        self.replaySpeedChooser.setCurrentIndex(2)
+        self.replaySpeedChooser.currentIndexChanged.connect(self.replaySpeedChanged)
+        self.replayToolbar.addWidget(self.replaySpeedChooser)
+
+        self.replaySlider = QSlider(Qt.Orientation.Horizontal)
+        self.replaySlider.setStatusTip(self.tr('Seek'))
+        self.replaySlider.sliderMoved.connect(self.replayThread.seek)
+        self.replayToolbar.addWidget(self.replaySlider)
+        self.replayToolbar.hide()
+
         # Layouts
-        self.labelLayout = QGridLayout()
         self.totalLayout = QGridLayout()
 
-        # for _ in range(numBlock):
-        #     self.labels[_].setText('255')
-        #     self.labels[_].setFont(QFont("Arial", 10))
-        #     self.labels[_].setAlignment(Qt.AlignmentFlag.AlignCenter)
-        #     self.labels[_].setStyleSheet(
-        #         f"background-color: rgb({colorData[_][0]}, {colorData[_][1]}, {colorData[_][2]});")
-        #     self.labelLayout.addWidget(self.labels[_], _ // int(numBlock ** 0.5), _ % int(numBlock ** 0.5))
-
-        for i in range(blockRow):
-            for j in range(blockColumn):
-                self.labelArray[i][j].setText('255')
-                self.labelArray[i][j].setFont(QFont("Arial", 10))
-                self.labelArray[i][j].setAlignment(Qt.AlignmentFlag.AlignCenter)
-                self.labelArray[i][j].setStyleSheet(
-                    f"background-color: rgb({colorData[i * blockColumn + j][0]}, {colorData[i * blockColumn + j][1]}, {colorData[i * blockColumn + j][2]});")
-                self.labelLayout.addWidget(self.labelArray[i][j], i, j)
-
-        self.totalLayout.addLayout(self.labelLayout, 0, 0)
+        self.totalLayout.addWidget(self.heatmap, 0, 0)
 
         centralWidget = QWidget()
         centralWidget.setLayout(self.totalLayout)
@@ -170,7 +459,13 @@ class MainWindow(QMainWindow):
 
         self.timer.timeout.connect(self.changeColor)
         self.timer.start()
+        self.metricsTimer.start()
         self.setNameList()
+        self.updateRois()
+        try:
+            updatePublisher()
+        except (OSError, ValueError) as e:
+            print(f'Publisher error:\n{str(e)}')
 
     def getCurrentSerialIndex(self):
         return self.currentSerialIndex
@@ -185,18 +480,31 @@ class MainWindow(QMainWindow):
         self.serialChooser.currentIndexChanged.connect(self.serialIndexChanged)
 
     def settingButtonClicked(self):
-        global numBlockChanged, timeIntervalChanged
+        global numBlockChanged, timeIntervalChanged, portRegionsChanged, historyChanged
         settingDialog = SettingDialog(self)
         settingDialog.exec()
         if numBlockChanged:
-            self.updateLabels()
+            self.updateHeatmap()
             numBlockChanged = False
+        else:
+            if historyChanged:
+                self.updateHistory()
+            # Colors or numbers may have changed
+            self.heatmap.redraw()
+        historyChanged = False
+        if portRegionsChanged:
+            self.refresh()
+            portRegionsChanged = False
         if timeIntervalChanged:
             self.timer.setInterval(timeInterval)
             timeIntervalChanged = False
+        try:
+            updatePublisher()
+        except (OSError, ValueError) as e:
+            self.errorMessage.warning(self, self.tr('Error'), f'Publisher:\n{str(e)}')
 
     def startButtonActionTriggered(self):
-        global startReading, firstRead
+        global startReading
         try:
             if not startReading:
                 self.startRunning()
@@ -208,6 +516,10 @@ class MainWindow(QMainWindow):
             self.errorMessage.warning(self, self.tr('Error'), f'startButtonActionTriggered:\n{str(e)}')
 
     def refresh(self):
+        global currentSerial
+        # The chooser goes back to no port, so the open one is closed
+        if currentSerial.is_open:
+            currentSerial.close()
         self.serialChooser.currentIndexChanged.disconnect(self.serialIndexChanged)
         self.setNameList()
 
@@ -218,141 +530,408 @@ class MainWindow(QMainWindow):
                 currentSerial.close()
                 print(f'{nameList[self.currentSerialIndex]} is closed.')
             self.currentSerialIndex = index
+            # The bytes/s of the new port start from its own count
+            self.lastReceivedCount = None
             if self.currentSerialIndex != -1:
-                currentSerial = serial.Serial(portList[self.currentSerialIndex], 115200)
-                print(f'{nameList[self.currentSerialIndex]} is opened.')
-                currentSerial.close()
+                self.closeSession()
+                if portList[self.currentSerialIndex] == multiPortName:
+                    # The ports are only opened by the acquisition, currentSerial stays a closed placeholder
+                    currentSerial = serial.Serial()
+                    print(f'{nameList[self.currentSerialIndex]}: {formatPortRegions(portRegions)}')
+                    return
+                if portList[self.currentSerialIndex] == simulatorPort:
+                    currentSerial = acquisitionSetup().createSimulator(blockRow, blockColumn)
+                else:
+                    # Stays open until another port is chosen, start and stop only start and stop reading
+                    values = portSettings(serialSettings, portList[self.currentSerialIndex])
+                    currentSerial = createSerial(portList[self.currentSerialIndex], values)
+                    openSerial(currentSerial, values)
+                    print(f'{nameList[self.currentSerialIndex]} is opened at {values["baud_rate"]} baud.')
         except BaseException as e:
             self.stopRunning()
             self.refresh()
             self.errorMessage.warning(self, self.tr('Error'), f'serialIndexChanged:\n{str(e)}')
 
+    def openSession(self):
+        global blockRow, blockColumn, numBlock
+        path = QFileDialog.getExistingDirectory(self, self.tr('Open session'), 'data')
+        if not path:
+            return
+        try:
+            if startReading:
+                self.stopRunning()
+            session = SessionReader(path)
+            self.serialChooser.setCurrentIndex(-1)
+            self.replayThread.session = session
+            self.replayThread.position = 0
+            blockRow = session.header.get('blockRow', 1)
+            blockColumn = session.header.get('blockColumn', session.numBlock)
+            numBlock = session.numBlock
+            self.updateHeatmap()
+            self.replaySlider.setRange(0, max(len(session) - 1, 0))
+            self.replaySlider.setValue(0)
+            self.replayToolbar.show()
+            print(f'{path} is opened, {len(session)} frames.')
+        except BaseException as e:
+            self.closeSession()
+            self.errorMessage.warning(self, self.tr('Error'), f'openSession:\n{str(e)}')
+
+    def closeSession(self):
+        if self.replayThread.session is not None:
+            if startReading:
+                self.stopRunning()
+            self.replayThread.session = None
+            self.replayToolbar.hide()
+
+    def pauseToggled(self, checked):
+        self.replayThread.paused = checked
+
+    def replaySpeedChanged(self):
+        self.replayThread.speed = self.replaySpeedChooser.currentData()
+
+    def replayFinished(self):
+        if startReading and self.replayThread.session is not None:
+            self.stopRunning()
+
     def startRunning(self):
-        global startReading, currentSerial, startTime, totalDataList, totalTimeList
+        global startReading, currentSerial, startTime, serialReadingThreadRunning, recorder, alarmEngine
         startReading = True
-        self.dataCount = 0
         startTime = datetime.datetime.now().strftime('%Y-%m-%d %H.%M.%S')
-        totalDataList.clear()
-        totalTimeList.clear()
         self.startButtonAction.setIcon(QIcon('img/stop.svg'))
         self.startButtonAction.setStatusTip(self.tr('Stop reading'))
         self.startButtonAction.setText(self.tr('Stop'))
-        if currentSerial is not None:
-            if not currentSerial.is_open:
-                currentSerial.open()
+        displayQueue.clear()
+        rollingStats.reset()
+        self.heatmap.setAlarms(np.zeros(numBlock, dtype=bool))
+        self.lastAlarmEventCount = 0
+        if alarmRules and self.replayThread.session is None:
+            try:
+                alarmEngine = createAlarmEngine()
+                alarmEngine.start()
+            except ValueError as e:
+                # The grid may have changed since the rules were set, like ROIs they are then left out
+                alarmEngine = None
+                self.statusBar().showMessage(self.tr('Alarm rules not used: {0}').format(str(e)))
+        if self.replayThread.session is not None:
+            # Replayed frames are already recorded, so they only go to the display
+            if self.replayThread.position >= len(self.replayThread.session):
+                self.replayThread.position = 0
+            self.replayThread.running = True
+            self.replayThread.start()
+        elif busEnabled and self.currentSerialIndex != -1:
+            self.startBus(None if portList[self.currentSerialIndex] == multiPortName
+                          else portList[self.currentSerialIndex])
+        elif self.currentSerialIndex != -1 and portList[self.currentSerialIndex] == multiPortName:
+            self.acquisition = createAcquisition()
+            recorder = createRecorder()
+            recorder.start()
+            self.acquisition.start()
+            self.portStatsTimer.start()
+        elif currentSerial is not None:
+            setup = acquisitionSetup()
+            if isinstance(currentSerial, SimulatedSerial):
+                # Pick up settings changed since the simulator was chosen
+                currentSerial = setup.createPort(simulatorPort, blockRow, blockColumn)
+                setup.openPort(currentSerial)
+            elif not currentSerial.is_open:
+                setup.openPort(currentSerial)
+            else:
+                # Bytes that arrived while stopped are stale
+                currentSerial.reset_input_buffer()
+            self.serialReadingThread.parser = setup.createParser(blockRow, blockColumn)
+            recorder = createRecorder()
+            recorder.start()
+            serialReadingThreadRunning = True
+            self.serialReadingThread.start()
+
+    def startBus(self, port):
+        # port, or the [Ports] regions when it is None, is read in one process and recorded in another, this
+        # process only follows the bus for the display and the charts
+        global currentSerial
+        if currentSerial.is_open:
+            currentSerial.close()
+        text = configText()
+        context = multiprocessing.get_context('spawn')
+        self.bus = FrameBus(None, numBlock, busCapacity)
+        self.busReader = BusReader(self.bus, displayFrame)
+        self.acquisitionStopEvent = context.Event()
+        self.recordingStopEvent = context.Event()
+        self.recordingProcess = context.Process(target=recordFromBus, name='Recording', daemon=True,
+                                                args=(text, self.bus.name, 'data', self.recordingStopEvent))
+        self.acquisitionProcess = context.Process(target=publishToBus, name='Acquisition', daemon=True,
+                                                  args=(text, port, self.bus.name, self.acquisitionStopEvent))
+        self.busReader.start()
+        self.recordingProcess.start()
+        self.acquisitionProcess.start()
+        self.portStatsTimer.start()
+        print(f'Reading {port or formatPortRegions(portRegions)} in process {self.acquisitionProcess.pid}, '
+              f'recording in process {self.recordingProcess.pid}')
+
+    def stopBus(self):
+        # Reading stops first, recording once every frame on the bus is written. Also undoes a startBus that
+        # failed partway, whatever it did not get to is skipped
+        self.portStatsTimer.stop()
+        for process, stopEvent, timeout in ((self.acquisitionProcess, self.acquisitionStopEvent, 5),
+                                            (self.recordingProcess, self.recordingStopEvent, 10)):
+            if process is None or process.pid is None:
+                continue
+            stopEvent.set()
+            process.join(timeout)
+            if process.is_alive():
+                print(f'{process.name} process did not stop, terminated.')
+                process.terminate()
+                process.join()
+        if self.busReader is not None:
+            self.busReader.stop()
+            print(f'Bus: {self.bus.sequence} frames, displayed: {self.busReader.frameCount}, '
+                  f'lost by the display: {self.busReader.lostFrameCount}')
+        self.bus.close()
+        self.bus = None
+        self.busReader = None
+        self.acquisitionProcess = None
+        self.recordingProcess = None
 
     def stopRunning(self):
-        global startReading, firstRead, currentSerial, serialReadingThreadRunning
+        global startReading, currentSerial, serialReadingThreadRunning, recorder, alarmEngine
         startReading = False
         serialReadingThreadRunning = False
         self.serialReadingThread.wait()
-        self.excelWritingThread.wait()
-        self.excelWritingThread.start()
+        self.replayThread.running = False
+        self.replayThread.wait()
+        if self.bus is not None:
+            self.stopBus()
+        if self.acquisition is not None:
+            self.portStatsTimer.stop()
+            self.acquisition.stop()
+            for stats in self.acquisition.stats():
+                print(f'{stats["port"]}: {stats["health"]}, frames: {stats["frames"]}, '
+                      f'malformed: {stats["malformedFrames"]}, stale: {stats["staleFrames"]}')
+            print(f'Merged frames: {self.acquisition.merger.mergedFrameCount}')
+            self.acquisition = None
+        parser = self.serialReadingThread.parser
+        if parser is not None:
+            print(f'Frames: {parser.frameCount}, malformed: {parser.malformedFrameCount}, '
+                  f'partial: {parser.partialFrameCount}, discarded bytes: {parser.discardedByteCount}')
+            # Only the run that read the single port has a parser, the next run may be a bus, ports or a replay
+            self.serialReadingThread.parser = None
+        if recorder is not None:
+            recorder.stop()
+            print(f'Frames recorded: {recorder.writtenFrameCount}, dropped: {recorder.droppedFrameCount}')
+            recorder = None
+        if alarmEngine is not None:
+            alarmEngine.stop()
+            print(f'Alarm events: {alarmEngine.eventCount}, frames not checked: {alarmEngine.droppedFrameCount}')
+            alarmEngine = None
+            self.heatmap.setAlarms(np.zeros(numBlock, dtype=bool))
         self.startButtonAction.setIcon(QIcon('img/start.svg'))
         self.startButtonAction.setStatusTip(self.tr('Start reading'))
         self.startButtonAction.setText(self.tr('Start'))
-        if currentSerial:
-            if currentSerial.is_open:
-                currentSerial.close()
-                firstRead = True
-
-    def updateLabels(self):
-        global colorData, totalData
-        # for _ in range(len(self.labels)):
-        #     self.labels[_].deleteLater()
-        # delete labels in self.labelArray
-        for i in range(previousBlockRow):
-            for j in range(previousBlockColumn):
-                self.labelArray[i][j].deleteLater()
-
-        # self.labels = [ColorLabel(_) for _ in range(numBlock)]
+        if isinstance(currentSerial, SimulatedSerial) and currentSerial.is_open:
+            currentSerial.close()
 
-        self.labelArray = [[ColorLabel(j * blockColumn + i) for i in range(blockColumn)] for j in range(blockRow)]
+    def updateHeatmap(self):
+        global colorData, totalData, rollingStats
         colorData = [[255, 255, 255] for _ in range(numBlock)]
         totalData = [(maxDataNum + minDataNum) // 2 for _ in range(numBlock)]
-        self.labelLayout = QGridLayout()
-
-        # for _ in range(numBlock):
-        #     self.labels[_].setText('255')
-        #     self.labels[_].setFont(QFont("Arial", 10))
-        #     self.labels[_].setAlignment(Qt.AlignmentFlag.AlignCenter)
-        #     self.labels[_].setStyleSheet(
-        #         f"background-color: rgb({colorData[_][0]}, {colorData[_][1]}, {colorData[_][2]});")
-        #     self.labelLayout.addWidget(self.labels[_], _ // int(numBlock ** 0.5), _ % int(numBlock ** 0.5))
-
-        for i in range(blockRow):
-            for j in range(blockColumn):
-                self.labelArray[i][j].setText('255')
-                self.labelArray[i][j].setFont(QFont("Arial", 10))
-                self.labelArray[i][j].setAlignment(Qt.AlignmentFlag.AlignCenter)
-                self.labelArray[i][j].setStyleSheet(
-                    f"background-color: rgb({colorData[i * blockColumn + j][0]}, {colorData[i * blockColumn + j][1]}, {colorData[i * blockColumn + j][2]});")
-                self.labelLayout.addWidget(self.labelArray[i][j], i, j)
-
-        self.totalLayout.removeItem(self.labelLayout)
-        self.totalLayout.addLayout(self.labelLayout, 0, 0)
+        rollingStats = RollingStats(numBlock, statsWindow, emaAlpha)
+        self.heatmap.setGrid()
+        self.updateHistory()
+        if publisher is not None:
+            # Subscribers have to reconnect for the new numBlock
+            updatePublisher()
+
+    def updateHistory(self):
+        global history
+        history = FrameHistory(xAxisLength + 1, numBlock)
+        self.updateRois()
+
+    def updateRois(self):
+        # After the ROIs or the grid changed. ROI charts are closed since their columns may be gone
+        global roiAggregator, roiHistory
+        try:
+            roiAggregator = RoiAggregator(rois, blockRow, blockColumn) if rois else None
+        except ValueError as e:
+            # The ROIs stay in the settings and come back with a grid they fit in
+            roiAggregator = None
+            self.statusBar().showMessage(self.tr('ROIs not used: {0}').format(str(e)))
+        columns = roiAggregator.columns() if roiAggregator is not None else []
+        roiHistory = FrameHistory(xAxisLength + 1, len(columns))
+        for lineChart in [_ for _ in self.heatmap.lineCharts.values() if isinstance(_.index, str)]:
+            lineChart.close()
+        self.roiChooser.clear()
+        self.roiChooser.addItem(self.tr('ROI chart'))
+        self.roiChooser.addItems(columns)
+        self.roiChooserAction.setVisible(bool(columns))
+
+    def openRoiChart(self, index):
+        if index > 0:
+            self.heatmap.openLineChart(self.roiChooser.itemText(index))
+            self.roiChooser.setCurrentIndex(0)
+
+    def updateMetrics(self):
+        # Copies the counters owned by the parsers and the recorder, then updates the summary and the dump
+        now = time.monotonic()
+        parsers = []
+        if self.acquisition is not None:
+            parsers = [(reader.port.port, reader.parser) for reader in self.acquisition.readers]
+        elif self.serialReadingThread.parser is not None:
+            parsers = [(currentSerial.port, self.serialReadingThread.parser)]
+        for port, parser in parsers:
+            metrics.set('malformedFrames', parser.malformedFrameCount, port=port)
+            metrics.set('partialFrames', parser.partialFrameCount, port=port)
+            metrics.set('discardedBytes', parser.discardedByteCount, port=port)
+        if recorder is not None:
+            setRecorderMetrics(recorder)
+            if recorder.error is not None:
+                self.serialReadingError(self.tr('Recorder:\n{0}').format(recorder.error))
+                return
+        metrics.set('displayCoalescedFrames', displayQueue.coalescedCount)
+        if alarmEngine is not None:
+            metrics.set('alarmsActive', int(alarmEngine.active.sum()))
+            metrics.set('alarmDroppedFrames', alarmEngine.droppedFrameCount)
+            if alarmEngine.eventCount != self.lastAlarmEventCount and alarmEngine.events:
+                self.lastAlarmEventCount = alarmEngine.eventCount
+                event = alarmEngine.events[-1]
+                self.statusBar().showMessage(
+                    self.tr('Alarm {0} {1} at block {2} ({3}, {4}): {5:.2f}, {6} events').format(
+                        event['rule'], event['event'], event['block'], event['row'], event['column'], event['value'],
+                        alarmEngine.eventCount))
+        if publisher is not None:
+            subscribers = publisher.stats()
+            metrics.set('publisherSubscribers', len(subscribers))
+            metrics.set('publisherQueuedFrames', sum(_['queued'] for _ in subscribers))
+            metrics.set('publisherDisconnectedSubscribers', publisher.disconnectedCount)
+        if self.bus is not None:
+            metrics.set('busFrames', self.bus.sequence)
+            metrics.set('busLostFrames', self.busReader.lostFrameCount)
+            if not self.acquisitionProcess.is_alive():
+                self.serialReadingError(
+                    self.tr('Acquisition process exited with code {0}').format(self.acquisitionProcess.exitcode))
+                return
+            if not self.recordingProcess.is_alive():
+                self.serialReadingError(
+                    self.tr('Recording process exited with code {0}').format(self.recordingProcess.exitcode))
+                return
+        for index, lineChart in self.heatmap.lineCharts.items():
+            metrics.set('lineChartFrameAgeSeconds', round(now - lineChart.lastFrameClock, 3), chart=index)
+
+        elapsed = max(now - self.lastMetricsClock, 1e-9)
+        publishedCount = metrics.counter('framesPublished')
+        framesPerSecond = (publishedCount - self.lastPublishedCount) / elapsed
+        self.lastPublishedCount = publishedCount
+        # Achieved bytes/s of the single port against what its baud rate and framing can carry
+        port = currentSerial.port or ''
+        receivedCount = metrics.counter('bytesReceived', port=port)
+        bytesPerSecond = (receivedCount - self.lastReceivedCount) / elapsed if self.lastReceivedCount is not None \
+            else 0.0
+        self.lastReceivedCount = receivedCount
+        self.lastMetricsClock = now
+        metrics.set('framesPerSecond', round(framesPerSecond, 1))
+        text = self.tr('{0:.0f} frames/s | render p99 {1:.1f} ms | queue {2}').format(
+            framesPerSecond, metrics.histogram('renderSeconds').quantile(0.99) * 1000,
+            len(recorder.queue) if recorder else 0)
+        if self.serialReadingThread.isRunning():
+            portLineRate = lineRate(portSettings(serialSettings, port))
+            metrics.set('serialBytesPerSecond', round(bytesPerSecond, 1), port=port)
+            metrics.set('serialLineRateBytesPerSecond', round(portLineRate, 1), port=port)
+            text += self.tr(' | {0:.1f} of {1:.1f} KiB/s').format(bytesPerSecond / 1024, portLineRate / 1024)
+        self.metricsLabel.setText(text)
+
+        if self.metricsDialog is not None and self.metricsDialog.isVisible():
+            self.metricsDialog.updateText()
+        if metricsPath and now - self.lastMetricsDump >= metricsDumpInterval:
+            self.lastMetricsDump = now
+            try:
+                metrics.dump(metricsPath)
+            except OSError as e:
+                print(f'Metrics dump failed:\n{str(e)}')
+
+    def showMetricsDialog(self):
+        if self.metricsDialog is None:
+            self.metricsDialog = MetricsDialog(self)
+        self.metricsDialog.updateText()
+        self.metricsDialog.show()
+
+    def showPortStats(self):
+        if self.busReader is not None:
+            stats = self.busReader.stats()
+            self.statusBar().showMessage(
+                self.tr('Acquisition process: {0} {1:.0f} fps, {2} lost by the display').format(
+                    stats['health'], stats['framesPerSecond'], stats['lostFrames']))
+        elif self.acquisition is not None:
+            self.statusBar().showMessage(' | '.join(
+                f'{_["port"]}: {_["health"]} {_["framesPerSecond"]:.0f} fps {_["bytesPerSecond"] / 1024:.1f} of '
+                f'{lineRate(portSettings(serialSettings, _["port"])) / 1024:.1f} KiB/s'
+                for _ in self.acquisition.stats()))
 
     def showErrorMessage(self, message):
         self.errorMessage.warning(self, self.tr('Error'), message)
 
+    def serialReadingError(self, message):
+        self.stopRunning()
+        self.refresh()
+        self.errorMessage.warning(self, self.tr('Error'), message)
+
     def changeColor(self):
-        global firstRead, startReading, currentSerial, serialReadingThreadRunning
+        global startReading, colorData, totalData
         if startReading:
             try:
-                if currentSerial is not None:
-                    if currentSerial.is_open:
-                        if not serialReadingThreadRunning:
-                            self.serialReadingThread.start()
-
-                            # for _ in range(numBlock):
-                            #     currentNum = totalData[_]
-                            #     self.labels[_].setText(str(currentNum))
-                            #     colorData[_] = getColor(currentNum)
-                            #     self.labels[_].setStyleSheet(
-                            #         f"background-color: rgb({colorData[_][0]}, {colorData[_][1]}, {colorData[_][2]});")
-
-                            for i in range(blockRow):
-                                for j in range(blockColumn):
-                                    currentNum = totalData[i * blockColumn + j]
-                                    self.labelArray[i][j].setText(str(totalData[i * blockColumn + j]))
-                                    colorData[i * blockColumn + j] = getColor(currentNum)
-                                    self.labelArray[i][j].setStyleSheet(
-                                        f"background-color: rgb({colorData[i * blockColumn + j][0]}, {colorData[i * blockColumn + j][1]}, {colorData[i * blockColumn + j][2]});")
-
-                            self.dataCount += 1
-
-                            if self.dataCount % 100 == 0:
-                                self.excelWritingThread.start()
+                # The reader (or replay) keeps replacing the frame in displayQueue, the timer only decides how
+                # often the latest one is shown
+                currentFrames = displayQueue.getBatch(timeout=0)
+                if currentFrames:
+                    totalData = currentFrames[-1]
+                    self.showLayer()
+                if alarmEngine is not None:
+                    self.heatmap.setAlarms(alarmEngine.activeCells)
+
+                if self.replayThread.session is not None and not self.replaySlider.isSliderDown():
+                    self.replaySlider.setValue(self.replayThread.position)
             except BaseException as e:
                 self.stopRunning()
                 self.refresh()
                 self.errorMessage.warning(self, self.tr('Error'), f'changeColor:\n{str(e)}')
 
+    def showLayer(self):
+        global colorData
+        renderStart = time.perf_counter()
+        currentTotalData = totalData if layer == 'raw' else rollingStats.layer(layer)
+        colorData = getColor(currentTotalData)
+
+        self.heatmap.setFrame(currentTotalData, colorData)
+        metrics.observe('renderSeconds', time.perf_counter() - renderStart)
+
+    def layerChanged(self, text):
+        global layer
+        layer = text
+        if rollingStats.count:
+            self.showLayer()
+
+    def captureBaseline(self):
+        rollingStats.captureBaseline()
+        if layer == 'delta' and rollingStats.count:
+            self.showLayer()
+
+    def resetPeak(self):
+        rollingStats.resetPeak()
+        if layer == 'peak' and rollingStats.count:
+            self.showLayer()
+
     def closeEvent(self, event):
         global currentSerial, startReading
         if startReading:
             self.stopRunning()
 
         self.serialReadingThread.wait()
-        self.excelWritingThread.wait()
-
-        config.set('Data', 'maxData', str(maxDataNum))
-        config.set('Data', 'minData', str(minDataNum))
-        config.set('Data', 'timeinterval', str(timeInterval))
-        config.set('Data', 'separation_between_rows', str(separationBetweenRows))
-        config.set('Data', 'separation_between_numbers', str(separationBetweenNumbers))
-        config.set('Display', 'numBlock', str(numBlock))
-        config.set('Display', 'blockRow', str(blockRow))
-        config.set('Display', 'blockColumn', str(blockColumn))
-        config.set('Color', 'startColor', ' '.join([str(i) for i in startColor]))
-        config.set('Color', 'endColor', ' '.join([str(i) for i in endColor]))
-        config.set('Color', 'intervalColor', ' '.join([str(i) for i in intervalColor]))
-        config.set('Graph', 'xAxisLength', str(xAxisLength))
-        config.set('General', 'language', language)
+
+        updateConfig()
 
         with open('config.ini', 'w') as f:
             config.write(f)
 
+        if publisher is not None:
+            publisher.stop()
+
         if currentSerial:
             currentSerial.close()
             print(f'{nameList[self.currentSerialIndex]} is closed.')
@@ -360,104 +939,233 @@ class MainWindow(QMainWindow):
 
 
 class SerialReadingThread(QThread):
+    errorOccurred = Signal(str)
+
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.parser = None
 
     def run(self):
-        global firstRead, startReading, currentSerial, totalData, serialReadingThreadRunning, totalDataList, \
-            totalTimeList, separationBetweenRows, separationBetweenNumbers, blockRow
         try:
-            serialReadingThreadRunning = True
-            currentTime = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
-            while firstRead:
-                currentData = currentSerial.readline()
-                if blockRow == 1:
-                    firstRead = False
-                if currentData[0] == separationBetweenRows:
-                    firstRead = False
-            currentTotalData = []
-            if blockRow == 1:
-                separationBias = False
-            else:
-                separationBias = True
-
-            for _ in range(blockRow):
-                currentData = currentSerial.readline()
-                while currentData == b'\n' or currentData == b'\r\n' or currentData == b' ' or currentData == b'':
-                    currentData = currentSerial.readline()
-                currentArr = currentData.decode('utf-8').split(chr(separationBetweenNumbers))
-                for i in currentArr:
-                    if i != ' ' and i != '':
-                        currentTotalData.append(float(i))
-            if separationBias:
-                temp = currentSerial.readline()
-                while temp == b'\n' or temp == b'\r\n' or temp == b' ' or temp == b'':
-                    temp = currentSerial.readline()
-            totalData = currentTotalData
-            totalDataList.append(currentTotalData)
-            totalTimeList.append(currentTime)
-            serialReadingThreadRunning = False
+            while serialReadingThreadRunning:
+                # Take everything the OS has buffered in one call, or wait up to the port timeout for a byte.
+                # Only reads of buffered bytes are timed, a read that waits for the next byte would time the wait
+                waiting = currentSerial.in_waiting
+                readStart = time.perf_counter()
+                currentData = currentSerial.read(waiting or 1)
+                if waiting:
+                    metrics.observe('serialReadSeconds', time.perf_counter() - readStart, port=currentSerial.port)
+                if not currentData:
+                    continue
+                metrics.increment('bytesReceived', len(currentData), port=currentSerial.port)
+                currentTime = time.time_ns()
+                parseStart = time.perf_counter()
+                currentFrames = self.parser.feed(currentData)
+                metrics.observe('parseSeconds', time.perf_counter() - parseStart, port=currentSerial.port)
+                metrics.increment('framesParsed', len(currentFrames), port=currentSerial.port)
+                for currentTotalData in currentFrames:
+                    publishFrame(currentTime, currentTotalData)
         except BaseException as e:
-            self.parent().stopRunning()
-            # self.parent().refresh()
             print(f'SerialReadingThread error:\n{str(e)}')
+            self.errorOccurred.emit(f'SerialReadingThread:\n{str(e)}')
+
 
+class ReplayThread(QThread):
+    # Plays a session back through displayFrame, like SerialReadingThread does with the serial port but without
+    # recording it again
+    errorOccurred = Signal(str)
 
-class ExcelWritingThread(QThread):
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.session = None
+        self.running = False
+        self.paused = False
+        self.speed = 1
+        self.position = 0
+        self.seekPosition = None
+
+    def seek(self, position):
+        self.seekPosition = position
 
     def run(self):
-        global totalTimeList, totalDataList, startTime
-        currentTotalDataList = totalDataList[:]
-        currentTotalTimeList = totalTimeList[:]
-        totalDataList.clear()
-        totalTimeList.clear()
-
-        if 'data' not in os.listdir():
-            os.mkdir('data')
-
-        if f'totalData {startTime}.xlsx' not in os.listdir('data'):
-            with xw.App(visible=False) as app:
-                book = app.books.add()
-                sheet = book.sheets.add()
-                sheet.name = startTime
-                sheet.range('a:a').api.NumberFormat = '@'
-                sheet.range('A1').value = 'time'
-                sheet.range('B1').value = [f'block {_}' for _ in range(numBlock)]
-                book.save(f'data/totalData {startTime}.xlsx')
-
-        with xw.App(visible=False) as app:
-            book = app.books.open(f'data/totalData {startTime}.xlsx')
-            sheet = book.sheets[startTime]
-            newRow = sheet.used_range.last_cell.row + 1
-            sheet.range(f'A{newRow}').options(transpose=True).value = currentTotalTimeList
-            sheet.range(f'B{newRow}').options(expand='table').value = currentTotalDataList
-            book.save()
-            book.close()
-
-        # print('ExcelWritingThread finish')
-
-
-
-class ColorLabel(QLabel):
-    def __init__(self, index):
-        super().__init__()
-        self.index = index
-        self.lineChart = LineChart(self.index, self)
+        try:
+            replayedFrameCount = 0
+            # The display queue counts frames of every run, this replay only reports its own
+            coalescedCount = displayQueue.coalescedCount
+            startClock = time.perf_counter()
+            clockPosition = None
+            while self.running and self.position < len(self.session):
+                if self.seekPosition is not None:
+                    self.position = min(self.seekPosition, len(self.session) - 1)
+                    self.seekPosition = None
+                    # The charts start again from the new position
+                    history.clear()
+                    roiHistory.clear()
+                    clockPosition = None
+                if self.paused:
+                    clockPosition = None
+                    time.sleep(0.01)
+                    continue
+
+                currentTime = int(self.session.time[self.position])
+                speed = self.speed
+                if speed:
+                    # Frame times are replayed relative to the frame where playback (re)started
+                    if clockPosition is None or clockPosition[2] != speed:
+                        clockPosition = (time.perf_counter(), currentTime, speed)
+                    wait = clockPosition[0] + (currentTime - clockPosition[1]) / 1e9 / speed - time.perf_counter()
+                    if wait > 0:
+                        time.sleep(min(wait, 0.05))
+                        continue
+                else:
+                    clockPosition = None
+
+                displayFrame(currentTime, np.asarray(self.session.frames[self.position], dtype=np.float64), False)
+                replayedFrameCount += 1
+                self.position += 1
+
+            elapsed = time.perf_counter() - startClock
+            print(f'Replayed {replayedFrameCount} frames in {elapsed:.2f} s '
+                  f'({replayedFrameCount / max(elapsed, 1e-9):.0f} frames/s), '
+                  f'{displayQueue.coalescedCount - coalescedCount} not displayed')
+        except BaseException as e:
+            print(f'ReplayThread error:\n{str(e)}')
+            self.errorOccurred.emit(f'ReplayThread:\n{str(e)}')
+
+
+class HeatmapWidget(QWidget):
+    # Draws the whole block grid from one image in a single paintEvent, values are written on top
+    # only when the cells are large enough to read them
+    minTextCellWidth = 36
+    minTextCellHeight = 18
+    # Above this many changed cells one full repaint is cheaper than many small ones
+    maxDirtyCells = 64
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumSize(QSize(100, 100))
+        self.setFont(QFont("Arial", 10))
+        # Chart windows are only built when a cell is clicked: open ones by block index, closed ones in
+        # least recently used order
+        self.lineCharts = {}
+        self.chartPool = collections.OrderedDict()
+        self.setGrid()
+
+    def setGrid(self):
+        for lineChart in list(self.lineCharts.values()):
+            lineChart.close()
+
+        # Last rendered value of every cell and the pixels the image is drawn from, only cells whose value
+        # changed are written and repainted
+        self.values = np.full(numBlock, np.nan)
+        # Cells in alarm, outlined
+        self.alarms = np.zeros(numBlock, dtype=bool)
+        self.pixels = np.full((blockRow, blockColumn, 3), 255, dtype=np.uint8)
+        self.image = QImage(self.pixels.data, blockColumn, blockRow, blockColumn * 3, QImage.Format.Format_RGB888)
+        self.update()
+
+    def redraw(self):
+        # Every cell is written again with the next frame
+        self.values = np.full(numBlock, np.nan)
+        self.update()
+
+    def setFrame(self, values, colors):
+        values = np.asarray(values, dtype=np.float64)
+        changed = values != self.values
+        if not changed.any():
+            return
+        self.values = values
+        self.pixels.reshape(numBlock, 3)[changed] = np.asarray(colors, dtype=np.uint8)[changed]
+
+        changedIndex = np.flatnonzero(changed)
+        if len(changedIndex) > self.maxDirtyCells:
+            self.update()
+        else:
+            for index in changedIndex:
+                self.update(self.cellRect(index))
+
+    def setAlarms(self, alarms):
+        changed = alarms != self.alarms
+        if not changed.any():
+            return
+        self.alarms = alarms
+        changedIndex = np.flatnonzero(changed)
+        if len(changedIndex) > self.maxDirtyCells:
+            self.update()
+        else:
+            for index in changedIndex:
+                self.update(self.cellRect(index))
+
+    def cellRect(self, index):
+        cellWidth, cellHeight = self.cellSize()
+        row, column = divmod(int(index), blockColumn)
+        left, top = int(column * cellWidth), int(row * cellHeight)
+        return QRect(left, top, int((column + 1) * cellWidth) - left + 1, int((row + 1) * cellHeight) - top + 1)
+
+    def cellSize(self):
+        return self.width() / blockColumn, self.height() / blockRow
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.drawImage(self.rect(), self.image)
+        area = event.rect()
+        cellWidth, cellHeight = self.cellSize()
+
+        if self.alarms.any():
+            # Black with a yellow line inside stands out on any colour of the gradient, cells too small for both
+            # only get the yellow line
+            rects = [rect for rect in (self.cellRect(_) for _ in np.flatnonzero(self.alarms)) if rect.intersects(area)]
+            if min(cellWidth, cellHeight) >= 16:
+                painter.setPen(QPen(QColor(0, 0, 0), 4))
+                painter.drawRects([rect.adjusted(2, 2, -3, -3) for rect in rects])
+                painter.setPen(QPen(QColor(255, 255, 0), 2))
+                painter.drawRects([rect.adjusted(5, 5, -6, -6) for rect in rects])
+            else:
+                painter.setPen(QPen(QColor(255, 255, 0), 1))
+                painter.drawRects([rect.adjusted(0, 0, -2, -2) for rect in rects])
+            painter.setPen(QPen())
+
+        if showNumbers and cellWidth >= self.minTextCellWidth and cellHeight >= self.minTextCellHeight:
+            # Only the cells inside the repainted area
+            for i in range(int(area.top() // cellHeight), min(int(area.bottom() // cellHeight) + 1, blockRow)):
+                for j in range(int(area.left() // cellWidth), min(int(area.right() // cellWidth) + 1, blockColumn)):
+                    currentNum = self.values[i * blockColumn + j]
+                    if currentNum == currentNum:  # NaN until the first frame arrives
+                        painter.drawText(int(j * cellWidth), int(i * cellHeight), int(cellWidth), int(cellHeight),
+                                         Qt.AlignmentFlag.AlignCenter, str(round(currentNum, 2)))
+        painter.end()
 
     def mousePressEvent(self, event):
-        global activeLineChart
         if event.button() == Qt.MouseButton.LeftButton:
-            # print('left', self.index)
-            activeLineChart[self.index] = True
-            self.lineChart.reset()
-            self.lineChart.show()
-
-    def setText(self, arg__1):
-        super().setText(arg__1)
-        if activeLineChart[self.index]:
-            self.lineChart.dataUpdate(arg__1)
+            cellWidth, cellHeight = self.cellSize()
+            row = min(int(event.position().y() // cellHeight), blockRow - 1)
+            column = min(int(event.position().x() // cellWidth), blockColumn - 1)
+            index = row * blockColumn + column
+            self.openLineChart(index)
+
+    def openLineChart(self, index):
+        lineChart = self.lineCharts.get(index)
+        if lineChart is None:
+            if index in self.chartPool:
+                lineChart = self.chartPool.pop(index)
+            elif self.chartPool:
+                lineChart = self.chartPool.popitem(last=False)[1]
+            else:
+                lineChart = LineChart(index, self)
+                lineChart.closed.connect(self.lineChartClosed)
+            lineChart.setIndex(index)
+            self.lineCharts[index] = lineChart
+        lineChart.reset()
+        lineChart.show()
+        lineChart.raise_()
+
+    def lineChartClosed(self, lineChart):
+        if self.lineCharts.get(lineChart.index) is not lineChart:
+            return
+        del self.lineCharts[lineChart.index]
+        self.chartPool[lineChart.index] = lineChart
+        while len(self.chartPool) > chartPoolSize:
+            self.chartPool.popitem(last=False)[1].deleteLater()
 
 
 class SettingDialog(QDialog):
@@ -506,6 +1214,25 @@ class SettingDialog(QDialog):
         self.separationBetweenNumbersLabel = QLabel(self.tr('Separation between numbers:'))
         self.separationBetweenNumbersLineEdit = QLineEdit(chr(separationBetweenNumbers))
 
+        self.protocolLabel = QLabel(self.tr('Protocol:'))
+        self.protocolComboBox = QComboBox()
+        for _ in range(len(protocolList)):
+            self.protocolComboBox.addItem(protocolList[_][0], protocolList[_][1])
+            if protocol == protocolList[_][1]:
+                self.protocolComboBox.setCurrentIndex(_)
+
+        self.binarySampleTypeLabel = QLabel(self.tr('Binary sample type:'))
+        self.binarySampleTypeComboBox = QComboBox()
+        self.binarySampleTypeComboBox.addItems(list(binarySampleTypes))
+        self.binarySampleTypeComboBox.setCurrentText(binarySampleType)
+
+        self.recordFormatLabel = QLabel(self.tr('Record format:'))
+        self.recordFormatComboBox = QComboBox()
+        for _ in range(len(recordFormatList)):
+            self.recordFormatComboBox.addItem(recordFormatList[_][0], recordFormatList[_][1])
+            if recordFormat == recordFormatList[_][1]:
+                self.recordFormatComboBox.setCurrentIndex(_)
+
         self.dataFormLayout.addWidget(self.thresholdLabel, 0, 0, 1, 2)
         self.dataFormLayout.addWidget(self.maxNumLabel, 1, 0)
         self.dataFormLayout.addWidget(self.maxNumLineEdit, 1, 1)
@@ -517,6 +1244,39 @@ class SettingDialog(QDialog):
         self.dataFormLayout.addWidget(self.separationBetweenRowsLineEdit, 4, 1)
         self.dataFormLayout.addWidget(self.separationBetweenNumbersLabel, 5, 0)
         self.dataFormLayout.addWidget(self.separationBetweenNumbersLineEdit, 5, 1)
+        self.dataFormLayout.addWidget(self.protocolLabel, 6, 0)
+        self.dataFormLayout.addWidget(self.protocolComboBox, 6, 1)
+        self.dataFormLayout.addWidget(self.binarySampleTypeLabel, 7, 0)
+        self.dataFormLayout.addWidget(self.binarySampleTypeComboBox, 7, 1)
+        self.dataFormLayout.addWidget(self.recordFormatLabel, 8, 0)
+        self.dataFormLayout.addWidget(self.recordFormatComboBox, 8, 1)
+
+        self.recordPolicyLabel = QLabel(self.tr('When recording falls behind:'))
+        self.recordPolicyComboBox = QComboBox()
+        self.recordPolicyComboBox.addItems(queuePolicies)
+        self.recordPolicyComboBox.setCurrentText(recordPolicy)
+        self.dataFormLayout.addWidget(self.recordPolicyLabel, 11, 0)
+        self.dataFormLayout.addWidget(self.recordPolicyComboBox, 11, 1)
+
+        self.portRegionsLabel = QLabel(self.tr('Ports (port row column rows columns; ...):'))
+        self.portRegionsLineEdit = QLineEdit(formatPortRegions(portRegions))
+        self.portRegionsLineEdit.setPlaceholderText('COM3 0 0 2 4; COM4 2 0 2 4')
+        self.portMaxSkewLabel = QLabel(self.tr('Port max skew(s):'))
+        self.portMaxSkewLineEdit = QLineEdit(str(portMaxSkew))
+        self.portMaxSkewLineEdit.setValidator(QDoubleValidator())
+        self.dataFormLayout.addWidget(self.portRegionsLabel, 9, 0)
+        self.dataFormLayout.addWidget(self.portRegionsLineEdit, 9, 1)
+        self.dataFormLayout.addWidget(self.portMaxSkewLabel, 10, 0)
+        self.dataFormLayout.addWidget(self.portMaxSkewLineEdit, 10, 1)
+
+        self.busEnabledCheckBox = QCheckBox(self.tr('Read and record in separate processes'))
+        self.busEnabledCheckBox.setChecked(busEnabled)
+        self.busCapacityLabel = QLabel(self.tr('Frames shared between processes:'))
+        self.busCapacityLineEdit = QLineEdit(str(busCapacity))
+        self.busCapacityLineEdit.setValidator(QIntValidator(2, 1000000))
+        self.dataFormLayout.addWidget(self.busEnabledCheckBox, 12, 0, 1, 2)
+        self.dataFormLayout.addWidget(self.busCapacityLabel, 13, 0)
+        self.dataFormLayout.addWidget(self.busCapacityLineEdit, 13, 1)
         self.tabWidget.addTab(self.dataFrom, self.tr('Data'))
 
         self.displayForm = QWidget()
@@ -535,6 +1295,19 @@ class SettingDialog(QDialog):
         self.displayFormLayout.addWidget(self.setBlockRowLineEdit, 0, 1)
         self.displayFormLayout.addWidget(self.setBlockColumnLabel, 1, 0)
         self.displayFormLayout.addWidget(self.setBlockColumnLineEdit, 1, 1)
+        self.showNumbersCheckBox = QCheckBox(self.tr('Show numbers'))
+        self.showNumbersCheckBox.setChecked(showNumbers)
+        self.displayFormLayout.addWidget(self.showNumbersCheckBox, 2, 0, 1, 2)
+        self.statsWindowLabel = QLabel(self.tr('Rolling window(frames):'))
+        self.statsWindowLineEdit = QLineEdit(str(statsWindow))
+        self.statsWindowLineEdit.setValidator(QIntValidator(1, 1000000))
+        self.emaAlphaLabel = QLabel(self.tr('EMA alpha:'))
+        self.emaAlphaLineEdit = QLineEdit(str(emaAlpha))
+        self.emaAlphaLineEdit.setValidator(QDoubleValidator(0, 1, 6))
+        self.displayFormLayout.addWidget(self.statsWindowLabel, 3, 0)
+        self.displayFormLayout.addWidget(self.statsWindowLineEdit, 3, 1)
+        self.displayFormLayout.addWidget(self.emaAlphaLabel, 4, 0)
+        self.displayFormLayout.addWidget(self.emaAlphaLineEdit, 4, 1)
         # self.displayFormLayout.addWidget(self.setNumberOfBlocksLabel, 0, 0)
         # self.displayFormLayout.addWidget(self.setNumberOfBlocksLineEdit, 0, 1)
         self.tabWidget.addTab(self.displayForm, self.tr('Display'))
@@ -566,6 +1339,13 @@ class SettingDialog(QDialog):
         self.intervalColorDemonstration.setStyleSheet(
             f"background-color: rgb({intervalColor[0]}, {intervalColor[1]}, {intervalColor[2]});")
 
+        self.gradientLabel = QLabel(self.tr('Gradient'))
+        self.gradientComboBox = QComboBox()
+        self.gradientComboBox.addItem(self.tr('Custom'), 'Custom')
+        for _ in gradientPresets:
+            self.gradientComboBox.addItem(_, _)
+        self.gradientComboBox.setCurrentIndex(max(self.gradientComboBox.findData(gradient), 0))
+
         self.colorDialog = QColorDialog()
 
         self.colorFormLayout.addWidget(self.colorChangeLabel, 0, 0, 1, 3)
@@ -578,6 +1358,8 @@ class SettingDialog(QDialog):
         self.colorFormLayout.addWidget(self.intervalColorLabel, 3, 0)
         self.colorFormLayout.addWidget(self.intervalColorDemonstration, 3, 1)
         self.colorFormLayout.addWidget(self.intervalColorChangeButton, 3, 2)
+        self.colorFormLayout.addWidget(self.gradientLabel, 4, 0)
+        self.colorFormLayout.addWidget(self.gradientComboBox, 4, 1, 1, 2)
         self.tabWidget.addTab(self.colorForm, self.tr('Color'))
 
         self.graphForm = QWidget()
@@ -589,6 +1371,13 @@ class SettingDialog(QDialog):
 
         self.graphFormLayout.addWidget(self.xAxisLengthLabel, 0, 0)
         self.graphFormLayout.addWidget(self.setXAxisLengthLineEdit, 0, 1)
+
+        self.decimationLabel = QLabel(self.tr('Decimation:'))
+        self.decimationComboBox = QComboBox()
+        self.decimationComboBox.addItems(decimationList)
+        self.decimationComboBox.setCurrentText(decimation)
+        self.graphFormLayout.addWidget(self.decimationLabel, 1, 0)
+        self.graphFormLayout.addWidget(self.decimationComboBox, 1, 1)
         self.tabWidget.addTab(self.graphForm, self.tr('Graph'))
 
         self.generalForm = QWidget()
@@ -605,13 +1394,144 @@ class SettingDialog(QDialog):
 
         self.generalFormLayout.addWidget(self.languageLabel, 0, 0)
         self.generalFormLayout.addWidget(self.languageComboBox, 0, 1)
+
+        self.metricsPathLabel = QLabel(self.tr('Metrics file (.json or .prom):'))
+        self.metricsPathLineEdit = QLineEdit(metricsPath)
+        self.metricsDumpIntervalLabel = QLabel(self.tr('Metrics dump interval(s):'))
+        self.metricsDumpIntervalLineEdit = QLineEdit(str(metricsDumpInterval))
+        self.metricsDumpIntervalLineEdit.setValidator(QDoubleValidator())
+        self.generalFormLayout.addWidget(self.metricsPathLabel, 2, 0)
+        self.generalFormLayout.addWidget(self.metricsPathLineEdit, 2, 1)
+        self.generalFormLayout.addWidget(self.metricsDumpIntervalLabel, 3, 0)
+        self.generalFormLayout.addWidget(self.metricsDumpIntervalLineEdit, 3, 1)
         self.generalFormLayout.addWidget(QLabel(self.tr('Restart to change language')), 1, 0)
         self.tabWidget.addTab(self.generalForm, self.tr('General'))
 
+        self.simulatorForm = QWidget()
+        self.simulatorFormLayout = QGridLayout(self.simulatorForm)
+
+        self.simulatorFrameRateLabel = QLabel(self.tr('Frame rate(Hz):'))
+        self.simulatorFrameRateLineEdit = QLineEdit(str(simulatorFrameRate))
+        self.simulatorFrameRateLineEdit.setValidator(QDoubleValidator(0.1, 100000, 3))
+        self.simulatorWaveformLabel = QLabel(self.tr('Waveform:'))
+        self.simulatorWaveformComboBox = QComboBox()
+        self.simulatorWaveformComboBox.addItems(waveformList)
+        self.simulatorWaveformComboBox.setCurrentText(simulatorWaveform)
+        self.simulatorNoiseLabel = QLabel(self.tr('Noise(0-1):'))
+        self.simulatorNoiseLineEdit = QLineEdit(str(simulatorNoise))
+        self.simulatorNoiseLineEdit.setValidator(QDoubleValidator(0, 1, 3))
+        self.simulatorCorruptionLabel = QLabel(self.tr('Corrupted frames(0-1):'))
+        self.simulatorCorruptionLineEdit = QLineEdit(str(simulatorCorruption))
+        self.simulatorCorruptionLineEdit.setValidator(QDoubleValidator(0, 1, 3))
+
+        self.simulatorFormLayout.addWidget(self.simulatorFrameRateLabel, 0, 0)
+        self.simulatorFormLayout.addWidget(self.simulatorFrameRateLineEdit, 0, 1)
+        self.simulatorFormLayout.addWidget(self.simulatorWaveformLabel, 1, 0)
+        self.simulatorFormLayout.addWidget(self.simulatorWaveformComboBox, 1, 1)
+        self.simulatorFormLayout.addWidget(self.simulatorNoiseLabel, 2, 0)
+        self.simulatorFormLayout.addWidget(self.simulatorNoiseLineEdit, 2, 1)
+        self.simulatorFormLayout.addWidget(self.simulatorCorruptionLabel, 3, 0)
+        self.simulatorFormLayout.addWidget(self.simulatorCorruptionLineEdit, 3, 1)
+        self.tabWidget.addTab(self.simulatorForm, self.tr('Simulator'))
+
+        self.publisherForm = QWidget()
+        self.publisherFormLayout = QGridLayout(self.publisherForm)
+        self.publisherEnabledCheckBox = QCheckBox(self.tr('Stream frames to other programs'))
+        self.publisherEnabledCheckBox.setChecked(publisherEnabled)
+        self.publisherAddressLabel = QLabel(self.tr('Address(host:port):'))
+        self.publisherAddressLineEdit = QLineEdit(publisherAddress)
+        self.publisherQueueLengthLabel = QLabel(self.tr('Frames buffered per subscriber:'))
+        self.publisherQueueLengthLineEdit = QLineEdit(str(publisherQueueLength))
+        self.publisherQueueLengthLineEdit.setValidator(QIntValidator(1, 1000000))
+        self.publisherPolicyLabel = QLabel(self.tr('When a subscriber falls behind:'))
+        self.publisherPolicyComboBox = QComboBox()
+        self.publisherPolicyComboBox.addItems(publisherPolicies)
+        self.publisherPolicyComboBox.setCurrentText(publisherPolicy)
+        self.publisherFormLayout.addWidget(self.publisherEnabledCheckBox, 0, 0, 1, 2)
+        self.publisherFormLayout.addWidget(self.publisherAddressLabel, 1, 0)
+        self.publisherFormLayout.addWidget(self.publisherAddressLineEdit, 1, 1)
+        self.publisherFormLayout.addWidget(self.publisherQueueLengthLabel, 2, 0)
+        self.publisherFormLayout.addWidget(self.publisherQueueLengthLineEdit, 2, 1)
+        self.publisherFormLayout.addWidget(self.publisherPolicyLabel, 3, 0)
+        self.publisherFormLayout.addWidget(self.publisherPolicyComboBox, 3, 1)
+        self.tabWidget.addTab(self.publisherForm, self.tr('Publisher'))
+
+        self.alarmForm = QWidget()
+        self.alarmFormLayout = QGridLayout(self.alarmForm)
+        self.alarmRulesLabel = QLabel(
+            self.tr('Rules (name above|below|rate limit hysteresis duration [row column rows columns]; ...):'))
+        self.alarmRulesLineEdit = QLineEdit(formatAlarmRules(alarmRules))
+        self.alarmRulesLineEdit.setPlaceholderText('hot above 900 20 0.5; cold below 10 5 1 0 0 2 2')
+        self.alarmLogPathLabel = QLabel(self.tr('Event log:'))
+        self.alarmLogPathLineEdit = QLineEdit(alarmLogPath)
+        self.alarmFormLayout.addWidget(self.alarmRulesLabel, 0, 0, 1, 2)
+        self.alarmFormLayout.addWidget(self.alarmRulesLineEdit, 1, 0, 1, 2)
+        self.alarmFormLayout.addWidget(self.alarmLogPathLabel, 2, 0)
+        self.alarmFormLayout.addWidget(self.alarmLogPathLineEdit, 2, 1)
+        self.tabWidget.addTab(self.alarmForm, self.tr('Alarms'))
+
+        self.roiForm = QWidget()
+        self.roiFormLayout = QGridLayout(self.roiForm)
+        self.roisLabel = QLabel(self.tr('ROIs (name row column rows columns [+ row column rows columns]; ...):'))
+        self.roisLineEdit = QLineEdit(formatRois(rois))
+        self.roisLineEdit.setPlaceholderText('leftHeel 4 0 2 2; zoneA 0 0 2 4 + 2 0 1 1')
+        self.roiFormLayout.addWidget(self.roisLabel, 0, 0)
+        self.roiFormLayout.addWidget(self.roisLineEdit, 1, 0)
+        self.roiFormLayout.setRowStretch(2, 1)
+        self.tabWidget.addTab(self.roiForm, self.tr('ROI'))
+
+        # Settings of every port, or the overrides of one port
+        self.serialForm = QWidget()
+        self.serialFormLayout = QGridLayout(self.serialForm)
+        self.serialSettings = {port: dict(values) for port, values in serialSettings.items()}
+        self.serialPortLabel = QLabel(self.tr('Port:'))
+        self.serialPortComboBox = QComboBox()
+        self.serialPortComboBox.addItem(self.tr('All ports'), '')
+        for port in sorted(set(portList + list(self.serialSettings)) - {'', multiPortName}):
+            self.serialPortComboBox.addItem(port, port)
+        self.currentSerialPort = ''
+        self.baudRateLabel = QLabel(self.tr('Baud rate:'))
+        self.baudRateComboBox = QComboBox()
+        self.baudRateComboBox.setEditable(True)
+        self.baudRateComboBox.addItems([str(_) for _ in baudRateList])
+        self.baudRateComboBox.setValidator(QIntValidator(50, 100000000))
+        self.byteSizeLabel = QLabel(self.tr('Data bits:'))
+        self.byteSizeComboBox = QComboBox()
+        self.byteSizeComboBox.addItems([str(_) for _ in byteSizeList])
+        self.parityLabel = QLabel(self.tr('Parity:'))
+        self.parityComboBox = QComboBox()
+        self.parityComboBox.addItems(parityList)
+        self.stopBitsLabel = QLabel(self.tr('Stop bits:'))
+        self.stopBitsComboBox = QComboBox()
+        self.stopBitsComboBox.addItems([str(_) for _ in stopBitsList])
+        self.serialTimeoutLabel = QLabel(self.tr('Read timeout(s):'))
+        self.serialTimeoutLineEdit = QLineEdit()
+        self.serialTimeoutLineEdit.setValidator(QDoubleValidator(0.001, 10, 3))
+        self.rxBufferSizeLabel = QLabel(self.tr('Receive buffer(bytes, 0 = default):'))
+        self.rxBufferSizeLineEdit = QLineEdit()
+        self.rxBufferSizeLineEdit.setValidator(QIntValidator(0, 1 << 30))
+        self.loadSerialPort()
+        self.serialPortComboBox.currentIndexChanged.connect(self.serialPortChanged)
+
+        self.serialFormLayout.addWidget(self.serialPortLabel, 0, 0)
+        self.serialFormLayout.addWidget(self.serialPortComboBox, 0, 1)
+        self.serialFormLayout.addWidget(self.baudRateLabel, 1, 0)
+        self.serialFormLayout.addWidget(self.baudRateComboBox, 1, 1)
+        self.serialFormLayout.addWidget(self.byteSizeLabel, 2, 0)
+        self.serialFormLayout.addWidget(self.byteSizeComboBox, 2, 1)
+        self.serialFormLayout.addWidget(self.parityLabel, 3, 0)
+        self.serialFormLayout.addWidget(self.parityComboBox, 3, 1)
+        self.serialFormLayout.addWidget(self.stopBitsLabel, 4, 0)
+        self.serialFormLayout.addWidget(self.stopBitsComboBox, 4, 1)
+        self.serialFormLayout.addWidget(self.serialTimeoutLabel, 5, 0)
+        self.serialFormLayout.addWidget(self.serialTimeoutLineEdit, 5, 1)
+        self.serialFormLayout.addWidget(self.rxBufferSizeLabel, 6, 0)
+        self.serialFormLayout.addWidget(self.rxBufferSizeLineEdit, 6, 1)
+        self.tabWidget.addTab(self.serialForm, self.tr('Serial'))
+
         self.checkButtonBox = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok |
                                                QDialogButtonBox.StandardButton.Cancel)
-        self.checkButtonBox.accepted.connect(self.saveValues)
-        self.checkButtonBox.accepted.connect(self.accept)
+        self.checkButtonBox.accepted.connect(self.saveAndAccept)
         self.checkButtonBox.rejected.connect(self.reject)
 
         self.totalLayout.addWidget(self.checkButtonBox, 1, 0)
@@ -621,35 +1541,134 @@ class SettingDialog(QDialog):
     def changeLanguage(self):
         self.currentLanguage = self.languageComboBox.currentData()
 
+    def loadSerialPort(self):
+        values = portSettings(self.serialSettings, self.currentSerialPort)
+        self.baudRateComboBox.setCurrentText(str(values['baud_rate']))
+        self.byteSizeComboBox.setCurrentText(str(values['byte_size']))
+        self.parityComboBox.setCurrentText(values['parity'])
+        self.stopBitsComboBox.setCurrentText(str(values['stop_bits']))
+        self.serialTimeoutLineEdit.setText(str(values['timeout']))
+        self.rxBufferSizeLineEdit.setText(str(values['rx_buffer_size']))
+
+    def storeSerialPort(self):
+        values = {'baud_rate': int(self.baudRateComboBox.currentText()),
+                  'byte_size': int(self.byteSizeComboBox.currentText()),
+                  'parity': self.parityComboBox.currentText(),
+                  'stop_bits': float(self.stopBitsComboBox.currentText()),
+                  'timeout': float(self.serialTimeoutLineEdit.text()),
+                  'rx_buffer_size': int(self.rxBufferSizeLineEdit.text())}
+        if self.currentSerialPort:
+            # Only what differs from all ports is kept for one port
+            values = {key: value for key, value in values.items() if value != self.serialSettings[''][key]}
+            if values:
+                self.serialSettings[self.currentSerialPort] = values
+            else:
+                self.serialSettings.pop(self.currentSerialPort, None)
+        else:
+            self.serialSettings[''] = values
+
+    def serialPortChanged(self):
+        self.storeSerialPort()
+        self.currentSerialPort = self.serialPortComboBox.currentData()
+        self.loadSerialPort()
+
+    def saveAndAccept(self):
+        # The text fields are parsed before any setting changes, a mistake keeps the dialog open with nothing
+        # applied
+        try:
+            self.parseValues()
+        except ValueError as e:
+            QMessageBox.warning(self, self.tr('Error'), str(e))
+            return
+        self.saveValues()
+        self.accept()
+
+    def parseValues(self):
+        newBlockRow = int(self.setBlockRowLineEdit.text())
+        newBlockColumn = int(self.setBlockColumnLineEdit.text())
+        if startReading and (newBlockRow, newBlockColumn) != (blockRow, blockColumn):
+            # The running parser, recorder and alarm engine are built for the current grid
+            raise ValueError(self.tr('Stop reading before changing the grid size.'))
+        self.newAlarmRules = parseAlarmRules(self.alarmRulesLineEdit.text())
+        checkAlarmRules(self.newAlarmRules, newBlockRow, newBlockColumn)
+        self.newPortRegions = parsePortRegions(self.portRegionsLineEdit.text())
+        self.newRois = parseRois(self.roisLineEdit.text())
+
     def saveValues(self):
         global maxDataNum, minDataNum, startColor, endColor, intervalColor, xAxisLength, numBlock, numBlockChanged, \
             timeInterval, timeIntervalChanged, language, blockRow, blockColumn, separationBetweenRows,\
-            separationBetweenNumbers, previousBlockRow, previousBlockColumn, activeLineChart, totalData
+            separationBetweenNumbers, totalData, protocol, \
+            binarySampleType, gradient, showNumbers, recordFormat, simulatorFrameRate, simulatorWaveform, \
+            simulatorNoise, simulatorCorruption, decimation, portRegions, portMaxSkew, portRegionsChanged, \
+            metricsPath, metricsDumpInterval, recordPolicy, statsWindow, emaAlpha, rollingStats, serialSettings, \
+            busEnabled, busCapacity, publisherEnabled, publisherAddress, publisherQueueLength, publisherPolicy, \
+            alarmRules, alarmLogPath, rois, historyChanged
+        colorSettings = (maxDataNum, minDataNum, startColor, endColor, intervalColor, gradient)
+        historySettings = (blockRow, blockColumn, xAxisLength, rois)
         maxDataNum = int(self.maxNumLineEdit.text())
         minDataNum = int(self.minNumLineEdit.text())
         xAxisLength = int(self.setXAxisLengthLineEdit.text())
+        decimation = self.decimationComboBox.currentText()
         startColor = self.currentStartColor
         endColor = self.currentEndColor
         intervalColor = self.currentIntervalColor
+        gradient = self.gradientComboBox.currentData()
+        if colorSettings != (maxDataNum, minDataNum, startColor, endColor, intervalColor, gradient):
+            buildColorLut()
         # numBlock = int(self.setNumberOfBlocksLineEdit.text())
-        previousBlockRow = blockRow
-        previousBlockColumn = blockColumn
         blockRow = int(self.setBlockRowLineEdit.text())
         blockColumn = int(self.setBlockColumnLineEdit.text())
         numBlock = blockRow * blockColumn
-        activeLineChart = [False for _ in range(numBlock)]
+        showNumbers = self.showNumbersCheckBox.isChecked()
+        statsWindow = int(self.statsWindowLineEdit.text())
+        emaAlpha = float(self.emaAlphaLineEdit.text())
+        if (statsWindow, emaAlpha) != (rollingStats.window, rollingStats.alpha):
+            rollingStats = RollingStats(numBlock, statsWindow, emaAlpha)
         totalData = [(maxDataNum + minDataNum) // 2 for _ in range(numBlock)]
         separationBetweenRows = ord(self.separationBetweenRowsLineEdit.text())
         separationBetweenNumbers = ord(self.separationBetweenNumbersLineEdit.text())
-        numBlockChanged = True
+        protocol = self.protocolComboBox.currentData()
+        binarySampleType = self.binarySampleTypeComboBox.currentText()
+        recordFormat = self.recordFormatComboBox.currentData()
+        recordPolicy = self.recordPolicyComboBox.currentText()
+        simulatorFrameRate = float(self.simulatorFrameRateLineEdit.text())
+        simulatorWaveform = self.simulatorWaveformComboBox.currentText()
+        simulatorNoise = float(self.simulatorNoiseLineEdit.text())
+        simulatorCorruption = float(self.simulatorCorruptionLineEdit.text())
+        if self.newPortRegions != portRegions:
+            portRegions = self.newPortRegions
+            portRegionsChanged = True
+        portMaxSkew = float(self.portMaxSkewLineEdit.text())
+        busEnabled = self.busEnabledCheckBox.isChecked()
+        busCapacity = int(self.busCapacityLineEdit.text())
+        publisherEnabled = self.publisherEnabledCheckBox.isChecked()
+        publisherAddress = self.publisherAddressLineEdit.text().strip()
+        publisherQueueLength = int(self.publisherQueueLengthLineEdit.text())
+        publisherPolicy = self.publisherPolicyComboBox.currentText()
+        alarmRules = self.newAlarmRules
+        alarmLogPath = self.alarmLogPathLineEdit.text().strip()
+        rois = self.newRois
+        if (blockRow, blockColumn) != historySettings[:2]:
+            numBlockChanged = True
+        elif (xAxisLength, rois) != historySettings[2:]:
+            historyChanged = True
+        metricsPath = self.metricsPathLineEdit.text().strip()
+        self.storeSerialPort()
+        serialSettings = self.serialSettings
+        if currentSerial.is_open and not isinstance(currentSerial, SimulatedSerial):
+            # Baud rate, framing and timeout can change on the open port
+            currentSerial.apply_settings(pyserialSettings(portSettings(serialSettings, currentSerial.port)))
+        metricsDumpInterval = float(self.metricsDumpIntervalLineEdit.text())
         timeInterval = int(self.timeIntervalLineEdit.text())
         timeIntervalChanged = True
         language = self.currentLanguage
         print(f'Values saved.\nMax: {maxDataNum}, Min: {minDataNum}\n'
               f'Start color: {startColor}, End color: {endColor}, Interval color: {intervalColor}\n'
-              f'Maximum x-axis length: {xAxisLength}\n'
+              f'Gradient: {gradient}\n'
+              f'Maximum x-axis length: {xAxisLength}, decimation: {decimation}\n'
               f'Number of blocks: {numBlock}\n'
               f'Time interval: {timeInterval}\n'
+              f'Protocol: {protocol} ({binarySampleType})\n'
               f'Language: {language}')
 
     def startColorDialog(self):
@@ -680,21 +1699,58 @@ class SettingDialog(QDialog):
                 f"rgb({self.currentIntervalColor[0]}, {self.currentIntervalColor[1]}, {self.currentIntervalColor[2]});")
 
 
+class MetricsDialog(QDialog):
+    # Every counter, gauge and histogram, refreshed by MainWindow.updateMetrics while it is open
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(self.tr('Metrics'))
+        self.resize(QSize(500, 400))
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.totalLayout = QGridLayout()
+        self.totalLayout.addWidget(self.text, 0, 0)
+        self.setLayout(self.totalLayout)
+
+    def updateText(self):
+        snapshot = metrics.snapshot()
+        lines = [f'{key}: {value}' for key, value in sorted(snapshot['counters'].items())]
+        lines += [f'{key}: {value}' for key, value in sorted(snapshot['gauges'].items())]
+        lines += [f'{key}: {_["count"]} samples, p50 <= {_["p50"] * 1000:g} ms, p99 <= {_["p99"] * 1000:g} ms'
+                  for key, _ in sorted(snapshot['histograms'].items())]
+        position = self.text.verticalScrollBar().value()
+        self.text.setPlainText('\n'.join(lines))
+        self.text.verticalScrollBar().setValue(position)
+
+
 class LineChart(QMainWindow):
+    closed = Signal(object)
+
     def __init__(self, index, parent=None):
         super().__init__(parent)
+        # QtCharts is only loaded once the first chart is opened
+        from PySide6.QtCharts import QChart, QLineSeries, QChartView, QValueAxis
 
-        global xCount
-
-        xCount = 0
         # currentRow = str(index // int(numBlock))
         # currentColumn = str(index % int(numBlock))
 
         self.index = index
 
-        self.totalData = []
+        # The chart is a view of the shared history and reaches the series in one replace() per refresh.
+        # renderedCount is the history.count last drawn and pausedCount the frame the chart stopped at
+        self.renderedCount = -1
+        self.pausedCount = None
+        self.lastFrameClock = time.monotonic()
+        # Only about one point per pixel of the plot area is handed to the series
+        self.decimator = Decimator(decimation)
+        # The y axis follows the min and max of the window, kept up to date with only the new frames. minMaxKey
+        # is the (history, generation, column) they were pushed from
+        self.minMax = SlidingMinMax(1)
+        self.minMaxKey = None
         self.currentMinAxisX = 0
         self.startWriting = True
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.setInterval(chartRefreshInterval)
+        self.refreshTimer.timeout.connect(self.refresh)
         self.setWindowTitle(self.tr('Line chart'))
 
         self.lineChart = QChart()
@@ -703,7 +1759,7 @@ class LineChart(QMainWindow):
         self.lineChart.legend().hide()
         # self.lineChart.setTitle(self.tr(
         #     f'Label row {currentRow} column {currentColumn}'))
-        self.lineChart.setTitle(self.tr(f'Label {self.index}'))
+        self.lineChart.setTitle(self.title())
 
         self.series = QLineSeries()
         self.lineChart.addSeries(self.series)
@@ -745,50 +1801,110 @@ class LineChart(QMainWindow):
     def keyPressEvent(self, event):
         if event.key() == Qt.Key.Key_M:
             self.lineChart.zoomIn()
+            self.zoomChanged()
         if event.key() == Qt.Key.Key_N:
             self.lineChart.zoomOut()
+            self.zoomChanged()
 
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.RightButton:
             self.lineChart.zoomReset()
+            self.zoomChanged()
+
+    def setIndex(self, index):
+        self.index = index
+        self.lineChart.setTitle(self.title())
 
+    def title(self):
+        if isinstance(self.index, str):
+            return self.index
+        return self.tr(f'Label {self.index}')
 
-    def dataUpdate(self, num):
-        global xAxisLength, xCount
-        if len(self.totalData) > xAxisLength:
-            self.totalData.pop(0)
-            self.series.remove(0)
-            self.currentMinAxisX += 1
+    def source(self):
+        # Block charts read their column of history, ROI charts (index 'name aggregate') theirs of roiHistory
+        if isinstance(self.index, str):
+            return roiHistory, roiAggregator.columns().index(self.index)
+        return history, self.index
+
+    def zoomChanged(self):
+        # Decimate again for the new visible range
+        self.renderedCount = -1
+        self.refresh()
+
+    def refresh(self):
+        source, column = self.source()
+        count = source.count if self.pausedCount is None else self.pausedCount
+        if count == self.renderedCount and self.minMaxKey == (source, source.generation, column):
+            return
+        if self.decimator.method != decimation:
+            self.decimator = Decimator(decimation)
+        self.renderedCount = count
+        self.lastFrameClock = time.monotonic()
+        x, y = source.column(column, count)
+        if not len(x):
+            self.series.clear()
+            return
+        self.updateMinMax(source, column, x, y)
+        zoomed = self.lineChart.isZoomed()
+        if zoomed:
+            # Keep one point on each side so the line reaches the edges of the plot
+            start = max(np.searchsorted(x, self.axisX.min()) - 1, 0)
+            stop = np.searchsorted(x, self.axisX.max(), side='right') + 1
+            x, y = x[start:stop], y[start:stop]
+            if not len(x):
+                return
+        if not zoomed:
+            self.currentMinAxisX = x[0]
             self.axisX.setMin(self.currentMinAxisX)
-        self.totalData.append(float(num))
-        self.series.append(float(xCount), float(num))
-        minY = min(self.totalData)
-        maxY = max(self.totalData)
-        self.axisY.setMin(minY * 0.95)
-        self.axisY.setMax(maxY * 1.05)
-        self.axisX.setMax(xCount)
-        xCount += 1
+            self.axisX.setMax(max(x[-1], 1))
+            if self.minMax.min() is not None:
+                self.axisY.setMin(self.minMax.min() * 0.95)
+                self.axisY.setMax(self.minMax.max() * 1.05)
+        x, y = self.decimator.decimate(x, y, max(int(self.lineChart.plotArea().width()), 100), int(x[0]))
+        self.series.replace([QPointF(i, j) for i, j in zip(x.tolist(), y.tolist())])
+
+    def updateMinMax(self, source, column, x, y):
+        # Pushes the frames newer than the last one pushed. Another history, column or clear, or a gap wider
+        # than the window, starts again from the whole window
+        key = (source, source.generation, column)
+        stop = int(x[-1]) + 1
+        if key != self.minMaxKey or stop < self.minMax.count or stop - self.minMax.count > len(y):
+            self.minMaxKey = key
+            self.minMax = SlidingMinMax(source.capacity)
+            self.minMax.count = int(x[0])
+        for value in y[len(y) - (stop - self.minMax.count):].tolist():
+            self.minMax.push(value)
+        # Frames the reader overwrote while this window was copied
+        self.minMax.expire(int(x[0]))
 
     def reset(self):
-        global xCount
-        xCount = 0
-        self.totalData.clear()
-        self.series.clear()
-        self.axisX.setMax(1)
-        self.axisY.setMin(0)
-        self.axisY.setMax(0)
+        # Shows the recent history of the block straight away
+        self.decimator = Decimator(decimation)
+        self.pausedCount = None
+        self.renderedCount = -1
+        self.lineChart.zoomReset()
+        self.startButtonAction.setIcon(QIcon('img/stop.svg'))
+        self.startButtonAction.setText(self.tr('Stop'))
+        self.refresh()
+
+    def showEvent(self, event):
+        self.refreshTimer.start()
+        super().showEvent(event)
 
     def startButtonActionTriggered(self):
-        if activeLineChart[self.index]:
-            activeLineChart[self.index] = False
+        if self.pausedCount is None:
+            # Freeze on what is on screen
+            self.pausedCount = self.renderedCount if self.renderedCount >= 0 else self.source()[0].count
             self.startButtonAction.setIcon(QIcon('img/start.svg'))
             self.startButtonAction.setText(self.tr('Start'))
         else:
-            activeLineChart[self.index] = True
+            self.pausedCount = None
             self.startButtonAction.setIcon(QIcon('img/stop.svg'))
             self.startButtonAction.setText(self.tr('Stop'))
 
     def closeEvent(self, event):
-        activeLineChart[self.index] = False
+        metrics.remove('lineChartFrameAgeSeconds', chart=self.index)
+        self.refreshTimer.stop()
         # print(f'Line chart {self.index} closed.')
         event.accept()
+        self.closed.emit(self)
@@ -0,0 +1,67 @@
+from frameParser import AsciiFrameParser, BinaryFrameParser
+from simulatedSerial import SimulatedSerial, simulatorPort
+from serialTransport import loadSerialSettings, portSettings, createSerial, openSerial
+from metrics import metrics
+
+# Ports, simulators and frame parsers built from the [Data], [Serial] and [Simulator] settings, shared by the GUI
+# and headless, which must not import Qt
+
+
+class AcquisitionSetup:
+    def __init__(self, protocol, binarySampleType, separationBetweenRows, separationBetweenNumbers, serialSettings,
+                 simulatorSettings, minDataNum, maxDataNum):
+        self.protocol = protocol
+        self.binarySampleType = binarySampleType
+        self.separationBetweenRows = separationBetweenRows
+        self.separationBetweenNumbers = separationBetweenNumbers
+        self.serialSettings = serialSettings
+        # (frame rate, waveform, noise, corruption), see SimulatedSerial
+        self.simulatorSettings = simulatorSettings
+        self.minDataNum = minDataNum
+        self.maxDataNum = maxDataNum
+
+    def createSimulator(self, rows, columns):
+        simulator = SimulatedSerial(*self.simulatorSettings, self.minDataNum, self.maxDataNum)
+        simulator.configure(rows, columns, self.protocol, self.binarySampleType, self.separationBetweenRows,
+                            self.separationBetweenNumbers)
+        return simulator
+
+    def createPort(self, name, rows, columns):
+        # A closed port for a region of rows x columns, see MultiPortAcquisition
+        if name == simulatorPort:
+            port = self.createSimulator(rows, columns)
+            port.timeout = portSettings(self.serialSettings, simulatorPort)['timeout']
+            return port
+        return createSerial(name, portSettings(self.serialSettings, name))
+
+    def openPort(self, port):
+        if isinstance(port, SimulatedSerial):
+            port.open()
+        else:
+            openSerial(port, portSettings(self.serialSettings, port.port))
+
+    def createParser(self, rows, columns):
+        if self.protocol == 'binary':
+            return BinaryFrameParser(rows * columns, self.binarySampleType)
+        return AsciiFrameParser(rows, rows * columns, self.separationBetweenRows, self.separationBetweenNumbers)
+
+
+def loadAcquisitionSetup(config):
+    return AcquisitionSetup(config.get('Data', 'protocol', fallback='ascii'),
+                            config.get('Data', 'binary_sample_type', fallback='int16'),
+                            int(config.get('Data', 'separation_between_rows')),
+                            int(config.get('Data', 'separation_between_numbers')),
+                            loadSerialSettings(config),
+                            (float(config.get('Simulator', 'frame_rate', fallback='100')),
+                             config.get('Simulator', 'waveform', fallback='sine'),
+                             float(config.get('Simulator', 'noise', fallback='0')),
+                             float(config.get('Simulator', 'corruption', fallback='0'))),
+                            int(config.get('Data', 'minData')), int(config.get('Data', 'maxData')))
+
+
+def setRecorderMetrics(recorder):
+    metrics.set('recordQueueDepth', len(recorder.queue))
+    metrics.set('recordUnflushedFrames', len(recorder.queue) + recorder.writingFrameCount)
+    metrics.set('recordWrittenFrames', recorder.writtenFrameCount)
+    metrics.set('recordDroppedFrames', recorder.droppedFrameCount)
+    metrics.set('recordBlockedSeconds', round(recorder.queue.blockedSeconds, 3))
@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+import collections
+
+import numpy as np
+
+from frameQueue import FrameQueue
+from multiPort import regionIndex
+from recorder import formatTime
+from metrics import metrics
+
+alarmKinds = ['above', 'below', 'rate']
+
+
+def parseAlarmRules(text):
+    # 'name kind limit hysteresis duration [row column rows columns]; ...' ->
+    # [(name, kind, limit, hysteresis, duration, region), ...], region (row, column, rows, columns) or None for
+    # the whole grid. rate limits are in units per second, durations in seconds
+    rules = []
+    for entry in text.split(';'):
+        if not entry.strip():
+            continue
+        fields = entry.split()
+        if len(fields) not in (5, 9) or fields[1] not in alarmKinds:
+            raise ValueError(f'Alarm rule "{entry.strip()}" is not '
+                             f'"name above|below|rate limit hysteresis duration [row column rows columns]"')
+        region = tuple(int(_) for _ in fields[5:]) or None
+        rules.append((fields[0], fields[1], float(fields[2]), float(fields[3]), float(fields[4]), region))
+    return rules
+
+
+def checkAlarmRules(rules, blockRow, blockColumn):
+    # Raises ValueError when the region of a rule does not fit the grid
+    for rule in rules:
+        if rule[5] is not None:
+            regionIndex((rule[0],) + rule[5], blockRow, blockColumn)
+
+
+def formatAlarmRules(rules):
+    return '; '.join(' '.join(str(_) for _ in rule[:5] + (rule[5] or ())) for rule in rules)
+
+
+class AlarmEngine:
+    # Evaluates every rule on every frame in one pass over flat arrays of (rule, cell) pairs. A pair goes over
+    # when its value passes the limit and comes back only once it is hysteresis inside the limit again, its alarm
+    # is raised after it has been over for duration seconds and cleared when it comes back. below rules work on
+    # the negated values, rate rules on the absolute change per second since the previous frame.
+    # Like Recorder, frames are queued by the reader and evaluated on a thread of their own, raised and cleared
+    # alarms are appended to a CSV event log. activeCells is replaced, never changed, so the display can read it
+    # at any time
+    def __init__(self, rules, blockRow, blockColumn, logPath=None, queueLength=10000):
+        self.rules = rules
+        self.blockColumn = blockColumn
+        self.numBlock = blockRow * blockColumn
+        regions = [(rule[0],) + (rule[5] or (0, 0, blockRow, blockColumn)) for rule in rules]
+        cells = [regionIndex(_, blockRow, blockColumn) for _ in regions]
+        self.cell = np.concatenate(cells)
+        self.rule = np.repeat(np.arange(len(rules)), [len(_) for _ in cells])
+        kind = np.array([alarmKinds.index(rule[1]) for rule in rules])[self.rule]
+        self.isRate = kind == alarmKinds.index('rate')
+        self.sign = np.where(kind == alarmKinds.index('below'), -1.0, 1.0)
+        self.limit = np.array([rule[2] for rule in rules])[self.rule] * self.sign
+        self.hysteresis = np.array([rule[3] for rule in rules])[self.rule]
+        self.duration = (np.array([rule[4] for rule in rules]) * 1e9).astype(np.int64)[self.rule]
+        self.reset()
+
+        self.events = collections.deque(maxlen=100)
+        self.eventCount = 0
+        self.queue = FrameQueue(queueLength, 'dropOldest')
+        self.log = None
+        if logPath:
+            newFile = not os.path.exists(logPath) or os.path.getsize(logPath) == 0
+            self.log = open(logPath, 'a', newline='')
+            if newFile:
+                self.log.write('time,rule,kind,block,row,column,event,value\n')
+        self.thread = threading.Thread(target=self.run, name='AlarmEngine', daemon=True)
+        self.stopping = False
+
+    def reset(self):
+        self.over = np.zeros(len(self.cell), dtype=bool)
+        self.overSince = np.zeros(len(self.cell), dtype=np.int64)
+        self.active = np.zeros(len(self.cell), dtype=bool)
+        self.activeCells = np.zeros(self.numBlock, dtype=bool)
+        self.previous = None
+        self.previousTime = 0
+
+    @property
+    def droppedFrameCount(self):
+        return self.queue.droppedCount
+
+    def evaluate(self, timestamp, frame):
+        # Raised and cleared alarms as [(timestamp, pair, event, value), ...]
+        frame = np.asarray(frame, dtype=np.float64)
+        value = frame[self.cell] * self.sign
+        evaluated = None
+        if self.isRate.any():
+            if self.previous is not None and timestamp > self.previousTime:
+                rate = np.abs(frame - self.previous) * (1e9 / (timestamp - self.previousTime))
+                value[self.isRate] = rate[self.cell[self.isRate]]
+            else:
+                # Frames parsed from one read share a timestamp, rate pairs wait for a frame with a later one
+                evaluated = ~self.isRate
+            self.previous = frame
+            self.previousTime = timestamp
+
+        over = np.where(self.over, value > self.limit - self.hysteresis, value > self.limit)
+        if evaluated is not None:
+            over = np.where(evaluated, over, self.over)
+        self.overSince[over & ~self.over] = timestamp
+        active = over & (timestamp - self.overSince >= self.duration)
+        changed = np.flatnonzero(active != self.active)
+        self.over = over
+        self.active = active
+        if not len(changed):
+            return []
+        activeCells = np.zeros(self.numBlock, dtype=bool)
+        activeCells[self.cell[active]] = True
+        self.activeCells = activeCells
+        value *= self.sign
+        return [(timestamp, pair, 'raised' if raised else 'cleared', pairValue) for pair, raised, pairValue
+                in zip(changed.tolist(), active[changed].tolist(), value[changed].tolist())]
+
+    def describe(self, event):
+        timestamp, pair, action, value = event
+        name, kind = self.rules[self.rule[pair]][:2]
+        row, column = divmod(int(self.cell[pair]), self.blockColumn)
+        return {'time': formatTime(timestamp), 'rule': name, 'kind': kind, 'block': int(self.cell[pair]),
+                'row': row, 'column': column, 'event': action, 'value': float(value)}
+
+    def start(self):
+        self.thread.start()
+
+    def put(self, timestamp, frame):
+        self.queue.put((timestamp, frame))
+
+    def stop(self):
+        self.stopping = True
+        if self.thread.is_alive():
+            self.thread.join()
+        if self.log is not None:
+            self.log.close()
+
+    def run(self):
+        while not self.stopping or len(self.queue):
+            batch = self.queue.getBatch(timeout=0.1)
+            if not batch:
+                continue
+            evaluateStart = time.perf_counter()
+            events = []
+            for timestamp, frame in batch:
+                events += self.evaluate(timestamp, frame)
+            metrics.observe('alarmEvaluateSeconds', (time.perf_counter() - evaluateStart) / len(batch))
+            if not events:
+                continue
+            events = [self.describe(_) for _ in events]
+            self.events.extend(events)
+            self.eventCount += len(events)
+            metrics.increment('alarmEvents', len(events))
+            if self.log is not None:
+                self.log.write(''.join(f'{_["time"]},{_["rule"]},{_["kind"]},{_["block"]},{_["row"]},{_["column"]},'
+                                       f'{_["event"]},{_["value"]}\n' for _ in events))
+                self.log.flush()
@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from frameParser import AsciiFrameParser, BinaryFrameParser
+from simulatedSerial import SimulatedSerial
+from colorMap import ColorLut
+from recorder import recordingSinks
+from alarmEngine import AlarmEngine, parseAlarmRules
+from roi import RoiAggregator, parseRois
+
+# Each stage is run once for timing and once more under tracemalloc for peak memory, so the tracing
+# overhead does not end up in the latency numbers. Peak memory only counts Python allocations.
+
+
+def syntheticFrames(args):
+    simulator = SimulatedSerial(noise=0.1, seed=0)
+    simulator.configure(args.rows, args.columns, args.protocol, 'int16', ord('-'), ord(','))
+    return simulator, [simulator.values(_) for _ in range(args.frames)]
+
+
+def parseStage(args):
+    simulator, frames = syntheticFrames(args)
+    chunks = [simulator.encode(_) for _ in frames]
+    if args.protocol == 'binary':
+        parser = BinaryFrameParser(args.rows * args.columns, 'int16')
+    else:
+        parser = AsciiFrameParser(args.rows, args.rows * args.columns, ord('-'), ord(','))
+        # The ASCII parser waits for a row separator or a full line before the first frame
+        parser.feed(b'-\r\n' if args.rows != 1 else b'\r\n')
+    return lambda index: parser.feed(chunks[index]), None
+
+
+def colorStage(args):
+    _, frames = syntheticFrames(args)
+    lut = ColorLut([[0, 0, 255], [255, 255, 255], [255, 0, 0]], 0, 30)
+    return lambda index: lut.map(frames[index]), None
+
+
+def renderStage(args):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv)
+    import UI
+    UI.blockRow, UI.blockColumn, UI.numBlock = args.rows, args.columns, args.rows * args.columns
+    UI.buildColorLut()
+    window = UI.MainWindow()
+    window.timer.stop()
+    window.resize(800, 800)
+    window.show()
+    UI.startReading = True
+    _, frames = syntheticFrames(args)
+
+    def render(index):
+        UI.displayQueue.put(frames[index])
+        window.changeColor()
+        window.heatmap.repaint()
+        app.processEvents()
+    return render, None
+
+
+def lineChartStage(args):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv)
+    import UI
+    UI.history = UI.FrameHistory(UI.xAxisLength + 1, args.rows * args.columns)
+    lineChart = UI.LineChart(0)
+    lineChart.show()
+    _, frames = syntheticFrames(args)
+
+    def update(index):
+        UI.history.append(index, frames[index])
+        # Worst case, one series refresh per sample
+        lineChart.refresh()
+        app.processEvents()
+    return update, None
+
+
+def recordStage(args):
+    _, frames = syntheticFrames(args)
+    directory = tempfile.TemporaryDirectory()
+    sink = recordingSinks[args.recordFormat]
+    sink = sink(os.path.join(directory.name, f'benchmark.{sink.extension}'), args.rows * args.columns)
+    timestamp = time.time_ns()
+
+    def record(index):
+        sink.write([timestamp + index], frames[index][np.newaxis])
+        sink.flush(False)
+
+    def close():
+        sink.close()
+        directory.cleanup()
+    return record, close
+
+
+def alarmStage(args):
+    _, frames = syntheticFrames(args)
+    # A threshold and a rate rule over the whole grid and a threshold rule over a quarter of it
+    engine = AlarmEngine(parseAlarmRules(f'hot above 25 1 0.1; jump rate 500 50 0; '
+                                         f'zone below 5 1 0 0 0 {args.rows // 2 or 1} {args.columns // 2 or 1}'),
+                         args.rows, args.columns)
+    timestamp = time.time_ns()
+    return lambda index: engine.evaluate(timestamp + index * 10000000, frames[index]), None
+
+
+def roiStage(args):
+    _, frames = syntheticFrames(args)
+    # Four quadrants and the whole grid, per frame as the display path does it
+    rows, columns = args.rows // 2 or 1, args.columns // 2 or 1
+    aggregator = RoiAggregator(parseRois(f'a 0 0 {rows} {columns}; b 0 {args.columns - columns} {rows} {columns}; '
+                                         f'c {args.rows - rows} 0 {rows} {columns}; '
+                                         f'd {args.rows - rows} {args.columns - columns} {rows} {columns}; '
+                                         f'all 0 0 {args.rows} {args.columns}'), args.rows, args.columns)
+    return lambda index: aggregator.aggregate(frames[index]), None
+
+
+# A stage returns (step, close): step(index) handles frame index and close, when not None, releases what the
+# stage opened once it has run
+stages = {'parse': parseStage, 'color': colorStage, 'render': renderStage, 'lineChart': lineChartStage,
+          'record': recordStage, 'alarms': alarmStage, 'roi': roiStage}
+
+
+def runStage(name, args):
+    step, close = stages[name](args)
+    latency = np.empty(args.frames)
+    start = time.perf_counter()
+    for index in range(args.frames):
+        before = time.perf_counter()
+        step(index)
+        latency[index] = time.perf_counter() - before
+    elapsed = time.perf_counter() - start
+    if close is not None:
+        close()
+
+    step, close = stages[name](args)
+    tracemalloc.start()
+    for index in range(args.frames):
+        step(index)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if close is not None:
+        close()
+
+    return {'framesPerSecond': args.frames / elapsed,
+            'p50LatencyMs': float(np.percentile(latency, 50) * 1000),
+            'p99LatencyMs': float(np.percentile(latency, 99) * 1000),
+            'peakMemoryBytes': peak}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the throughput of each stage with synthetic frames')
+    parser.add_argument('--rows', type=int, default=32)
+    parser.add_argument('--columns', type=int, default=32)
+    parser.add_argument('--frames', type=int, default=1000)
+    parser.add_argument('--protocol', choices=['ascii', 'binary'], default='ascii')
+    parser.add_argument('--recordFormat', choices=list(recordingSinks), default='binary')
+    parser.add_argument('--stages', nargs='+', choices=list(stages), default=list(stages))
+    parser.add_argument('--output', help='JSON file to write, printed when omitted')
+    args = parser.parse_args()
+
+    result = {'rows': args.rows, 'columns': args.columns, 'frames': args.frames, 'protocol': args.protocol,
+              'recordFormat': args.recordFormat, 'python': sys.version.split()[0], 'stages': {}}
+    for _ in args.stages:
+        result['stages'][_] = runStage(_, args)
+
+    text = json.dumps(result, indent=4)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
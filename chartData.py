@@ -0,0 +1,201 @@
+import threading
+import collections
+
+import numpy as np
+
+
+class FrameHistory:
+    # The last capacity frames of every block in one preallocated ring, appended to once per frame by the
+    # reader and read by the line charts. Frames are numbered from 0 since the last clear(), generation counts
+    # the clears. Values are float32, the charts draw no finer than that and the ring is half the size
+    def __init__(self, capacity, numBlock):
+        self.capacity = capacity
+        self.numBlock = numBlock
+        self.time = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, numBlock), dtype=np.float32)
+        self.count = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp, frame):
+        with self.lock:
+            row = self.count % self.capacity
+            self.time[row] = timestamp
+            self.values[row] = frame
+            self.count += 1
+
+    def column(self, index, stop=None):
+        # (frame numbers, values) of one block from the oldest frame still held up to frame stop, copied so
+        # the reader can go on writing
+        with self.lock:
+            stop = self.count if stop is None else min(stop, self.count)
+            start = max(self.count - self.capacity, 0)
+            if stop <= start:
+                return np.empty(0), np.empty(0)
+            rows = np.arange(start, stop) % self.capacity
+            return np.arange(start, stop, dtype=np.float64), self.values[rows, index]
+
+    def clear(self):
+        with self.lock:
+            self.count = 0
+            self.generation += 1
+
+
+class SlidingMinMax:
+    # Minimum and maximum of the last window values in O(1) amortized time per value. NaN values take up
+    # their place in the window but are left out of the minimum and maximum, None while there is no other value
+    def __init__(self, window):
+        self.window = window
+        self.count = 0
+        self.minDeque = collections.deque()
+        self.maxDeque = collections.deque()
+
+    def push(self, value):
+        if value == value:
+            while self.minDeque and self.minDeque[-1][1] >= value:
+                self.minDeque.pop()
+            self.minDeque.append((self.count, value))
+            while self.maxDeque and self.maxDeque[-1][1] <= value:
+                self.maxDeque.pop()
+            self.maxDeque.append((self.count, value))
+
+        self.count += 1
+        oldest = self.count - self.window
+        if self.minDeque and self.minDeque[0][0] < oldest:
+            self.minDeque.popleft()
+        if self.maxDeque and self.maxDeque[0][0] < oldest:
+            self.maxDeque.popleft()
+
+    def expire(self, oldest):
+        # Drops the values pushed before value number oldest ahead of the window
+        while self.minDeque and self.minDeque[0][0] < oldest:
+            self.minDeque.popleft()
+        while self.maxDeque and self.maxDeque[0][0] < oldest:
+            self.maxDeque.popleft()
+
+    def min(self):
+        return self.minDeque[0][1] if self.minDeque else None
+
+    def max(self):
+        return self.maxDeque[0][1] if self.maxDeque else None
+
+    def clear(self):
+        self.count = 0
+        self.minDeque.clear()
+        self.maxDeque.clear()
+
+
+decimationList = ['minmax', 'lttb', 'none']
+
+
+class Decimator:
+    # Reduces (x, y) to about targetPoints points before they are drawn, with a min-max envelope or with
+    # largest-triangle-three-buckets. first is the sample number of x[0] and the samples are consecutive: a
+    # bucket holds the samples with the same number // per, so its result does not change when newer samples
+    # arrive and reduced buckets are cached, only the newest buckets are computed on each call.
+    def __init__(self, method='minmax'):
+        self.method = method
+        self.reset()
+
+    def reset(self):
+        self.per = 0
+        self.cacheFirst = 0
+        self.cacheX = np.empty(0)
+        self.cacheY = np.empty(0)
+
+    def decimate(self, x, y, targetPoints, first):
+        n = len(x)
+        if self.method == 'none' or n <= max(targetPoints, 4):
+            return x, y
+
+        pointsPerBucket = 2 if self.method == 'minmax' else 1
+        # A power of two so the bucket size only changes a few times while the history fills up
+        per = 1 << int(np.ceil(np.log2(n * pointsPerBucket / targetPoints)))
+        if per != self.per:
+            self.reset()
+            self.per = per
+
+        x0 = first
+        firstBucket = x0 // per
+        lastBucket = (x0 + n - 1) // per
+        headEnd = min((firstBucket + 1) * per - x0, n)
+        # The first bucket may be cut by the start of the window and the last one is still filling, an LTTB
+        # bucket also depends on the one after it
+        stableEnd = lastBucket if self.method == 'minmax' else lastBucket - 1
+        stableEnd = max(stableEnd, firstBucket + 1)
+
+        # Forget buckets that left the window, or everything when the window moved back (zoom)
+        drop = firstBucket + 1 - self.cacheFirst
+        if drop < 0:
+            self.reset()
+            self.per = per
+        elif drop > 0:
+            self.cacheX = self.cacheX[drop * pointsPerBucket:]
+            self.cacheY = self.cacheY[drop * pointsPerBucket:]
+            self.cacheFirst += drop
+        if not len(self.cacheX):
+            self.cacheFirst = firstBucket + 1
+
+        cachedEnd = self.cacheFirst + len(self.cacheX) // pointsPerBucket
+        if cachedEnd < stableEnd:
+            start = cachedEnd * per - x0
+            stop = stableEnd * per - x0
+            if self.method == 'minmax':
+                newX, newY = self.minMax(x, y, start, stop, per)
+            else:
+                anchorX, anchorY = (self.cacheX[-1], self.cacheY[-1]) if len(self.cacheX) else (x[0], y[0])
+                newX, newY = self.lttb(x, y, start, stop, per, anchorX, anchorY)
+            self.cacheX = np.concatenate((self.cacheX, newX))
+            self.cacheY = np.concatenate((self.cacheY, newY))
+
+        tailStart = max(stableEnd * per - x0, headEnd)
+        if self.method == 'minmax':
+            headX, headY = self.minMax(x, y, 0, headEnd, headEnd)
+            if tailStart < n:
+                tailX, tailY = self.minMax(x, y, tailStart, n, n - tailStart)
+            else:
+                tailX, tailY = np.empty(0), np.empty(0)
+        else:
+            headX, headY = x[:1], y[:1]
+            tailX, tailY = x[n - 1:], y[n - 1:]
+            if tailStart + per < n:
+                anchorX, anchorY = (self.cacheX[-1], self.cacheY[-1]) if len(self.cacheX) else (x[0], y[0])
+                lastX, lastY = self.lttb(x, y, tailStart, tailStart + per, per, anchorX, anchorY)
+                tailX, tailY = np.concatenate((lastX, tailX)), np.concatenate((lastY, tailY))
+        return np.concatenate((headX, self.cacheX, tailX)), np.concatenate((headY, self.cacheY, tailY))
+
+    @staticmethod
+    def minMax(x, y, start, stop, per):
+        # Minimum and maximum of every bucket of per samples in [start, stop), in the order they occurred
+        blocks = y[start:stop].reshape(-1, per)
+        low = blocks.argmin(axis=1)
+        high = blocks.argmax(axis=1)
+        base = start + np.arange(len(blocks)) * per
+        index = np.column_stack((base + np.minimum(low, high), base + np.maximum(low, high))).ravel()
+        return x[index], y[index]
+
+    @staticmethod
+    def lttb(x, y, start, stop, per, anchorX, anchorY):
+        # One point per bucket in [start, stop), the one making the largest triangle with the point chosen
+        # in the previous bucket and the average of the next bucket
+        count = (stop - start) // per
+        nextStart = np.minimum(start + per * (np.arange(count) + 1), len(x) - 1)
+        nextStop = np.maximum(np.minimum(nextStart + per, len(x)), nextStart + 1)
+        sumX = np.concatenate(([0], np.cumsum(x)))
+        sumY = np.concatenate(([0], np.cumsum(y)))
+        averageX = (sumX[nextStop] - sumX[nextStart]) / (nextStop - nextStart)
+        averageY = (sumY[nextStop] - sumY[nextStart]) / (nextStop - nextStart)
+
+        resultX = np.empty(count)
+        resultY = np.empty(count)
+        for b in range(count):
+            bucketX = x[start + b * per:start + (b + 1) * per]
+            bucketY = y[start + b * per:start + (b + 1) * per]
+            area = np.abs((anchorX - averageX[b]) * (bucketY - anchorY) - (anchorX - bucketX) * (averageY[b] - anchorY))
+            i = area.argmax()
+            anchorX = resultX[b] = bucketX[i]
+            anchorY = resultY[b] = bucketY[i]
+        return resultX, resultY
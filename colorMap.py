@@ -0,0 +1,37 @@
+import numpy as np
+
+# Odd so that the middle value of a three colour gradient lands exactly on the interval colour
+lutSize = 1025
+
+# Colour stops spread evenly from the minimum to the maximum value
+gradientPresets = {
+    'Heat': [[0, 0, 0], [255, 0, 0], [255, 255, 0], [255, 255, 255]],
+    'Rainbow': [[0, 0, 255], [0, 255, 255], [0, 255, 0], [255, 255, 0], [255, 0, 0]],
+    'Gray': [[0, 0, 0], [255, 255, 255]],
+}
+
+
+class ColorLut:
+    # Maps data values to RGB with one table lookup, the table is only built when the colours or the
+    # thresholds change
+    def __init__(self, stops, minDataNum, maxDataNum, size=lutSize):
+        stops = np.asarray(stops, dtype=np.float64)
+        positions = np.linspace(0, 1, len(stops))
+        x = np.linspace(0, 1, size)
+        self.table = np.empty((size, 3), dtype=np.uint8)
+        for channel in range(3):
+            self.table[:, channel] = np.interp(x, positions, stops[:, channel]).astype(np.uint8)
+
+        self.minDataNum = minDataNum
+        self.maxDataNum = maxDataNum
+        if maxDataNum > minDataNum:
+            self.scale = (size - 1) / (maxDataNum - minDataNum)
+        else:
+            self.scale = 0
+
+    def map(self, values):
+        # values of any shape -> uint8 array of the same shape plus a last axis of 3
+        index = (np.asarray(values, dtype=np.float64) - self.minDataNum) * self.scale + 0.5
+        # fmax/fmin also turn NaN into the minimum colour
+        index = np.fmin(np.fmax(index, 0), len(self.table) - 1)
+        return self.table[index.astype(np.intp)]
@@ -0,0 +1,35 @@
+import os
+import argparse
+
+import xlwings as xw
+
+from recorder import readRecording, formatTime
+
+
+def exportToExcel(path, excelPath=None):
+    # Offline conversion of a CSV or binary recording into the .xlsx layout the app used to write
+    path = path.rstrip('/\\')
+    timestamps, frames = readRecording(path)
+    if excelPath is None:
+        excelPath = os.path.splitext(path)[0] + '.xlsx'
+
+    with xw.App(visible=False) as app:
+        book = app.books.add()
+        sheet = book.sheets[0]
+        sheet.range('a:a').api.NumberFormat = '@'
+        sheet.range('A1').value = 'time'
+        sheet.range('B1').value = [f'block {_}' for _ in range(frames.shape[1])]
+        if len(timestamps):
+            sheet.range('A2').options(transpose=True).value = [formatTime(_) for _ in timestamps]
+            sheet.range('B2').value = frames.tolist()
+        book.save(excelPath)
+        book.close()
+    print(f'{path} -> {excelPath}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert recordings in data/ to Excel files')
+    parser.add_argument('paths', nargs='+', help='.csv, .bin or .session recordings')
+    args = parser.parse_args()
+    for _ in args.paths:
+        exportToExcel(_)
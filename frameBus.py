@@ -0,0 +1,146 @@
+import sys
+import time
+import threading
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+
+def attachMemory(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    memory = shared_memory.SharedMemory(name)
+    if multiprocessing.parent_process() is None:
+        # A process started on its own has its own resource tracker, which would unlink the ring when the
+        # process exits. Only the creator unlinks it
+        resource_tracker.unregister(memory._name, 'shared_memory')
+    return memory
+
+
+class FrameBus:
+    # The last capacity frames in a shared memory ring, written by one process and read by any number of others
+    # without going through pipes. The block holds an int64 header [sequence, capacity, numBlock], capacity int64
+    # timestamps in ns and capacity x numBlock float64 values. sequence counts the frames written so far and
+    # frame n lives in slot n % capacity. The writer fills the slot before it advances sequence, so a reader only
+    # sees finished frames as long as it stays less than capacity frames behind.
+    headerLength = 3
+
+    def __init__(self, name=None, numBlock=0, capacity=1024):
+        # A new ring when name is None, otherwise the ring another process created under that name
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(
+                create=True, size=8 * (self.headerLength + capacity + capacity * numBlock))
+            np.ndarray(self.headerLength, np.int64, self.memory.buf)[:] = (0, capacity, numBlock)
+        else:
+            self.memory = attachMemory(name)
+        self.name = self.memory.name
+        self.header = np.ndarray(self.headerLength, np.int64, self.memory.buf)
+        self.capacity = int(self.header[1])
+        self.numBlock = int(self.header[2])
+        self.time = np.ndarray(self.capacity, np.int64, self.memory.buf, 8 * self.headerLength)
+        self.values = np.ndarray((self.capacity, self.numBlock), np.float64, self.memory.buf,
+                                 8 * (self.headerLength + self.capacity))
+
+    @property
+    def sequence(self):
+        return int(self.header[0])
+
+    def write(self, timestamp, frame):
+        # Only one process, and one thread in it, may write
+        sequence = int(self.header[0])
+        slot = sequence % self.capacity
+        self.time[slot] = timestamp
+        self.values[slot] = frame
+        self.header[0] = sequence + 1
+
+    def read(self, start):
+        # (timestamps, frames, next, lost) of the frames from number start on, copied out of the ring. Frames
+        # already overwritten are skipped and counted in lost, the following read starts at next
+        stop = int(self.header[0])
+        first = max(start, stop - self.capacity)
+        rows = np.arange(first, stop) % self.capacity
+        timestamps, frames = self.time[rows], self.values[rows]
+        # The writer may have reused slots while they were copied, the slot of frame sequence included
+        overwritten = min(int(self.header[0]) + 1 - self.capacity - first, len(rows))
+        if overwritten > 0:
+            timestamps, frames = timestamps[overwritten:], frames[overwritten:]
+            first += overwritten
+        return timestamps, frames, stop, first - start
+
+    def close(self):
+        # The views have to go before the memory can be closed
+        self.header = self.time = self.values = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class BusReader:
+    # Follows a FrameBus on its own thread and passes every new frame to callback(timestamp, frame), like
+    # PortReader does with a port. The ring has no wake-up, an idle reader looks again every pollInterval
+    # seconds. Frames overwritten before they were read are counted in lostFrameCount
+    stallTimeout = 1.0
+
+    def __init__(self, bus, callback, cursor=None, pollInterval=0.005):
+        # Starts at frame cursor, or with the next frame written when it is None
+        self.bus = bus
+        self.callback = callback
+        self.pollInterval = pollInterval
+        self.cursor = bus.sequence if cursor is None else cursor
+        self.running = False
+        self.error = None
+        self.frameCount = 0
+        self.lostFrameCount = 0
+        self.lastFrameClock = 0
+        self.lastStatsClock = time.monotonic()
+        self.lastFrameCount = 0
+        self.thread = threading.Thread(target=self.run, name=f'BusReader {bus.name}', daemon=True)
+
+    def start(self):
+        self.running = True
+        self.lastFrameClock = self.lastStatsClock = time.monotonic()
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join()
+        # Whatever the writer got in before it stopped
+        if self.error is None:
+            self.readFrames()
+
+    def readFrames(self):
+        timestamps, frames, self.cursor, lost = self.bus.read(self.cursor)
+        self.lostFrameCount += lost
+        for timestamp, frame in zip(timestamps.tolist(), frames):
+            self.callback(timestamp, frame)
+        if len(timestamps):
+            self.frameCount += len(timestamps)
+            self.lastFrameClock = time.monotonic()
+        return len(timestamps)
+
+    def run(self):
+        try:
+            while self.running:
+                if not self.readFrames():
+                    time.sleep(self.pollInterval)
+        except BaseException as e:
+            self.error = str(e)
+            print(f'BusReader {self.bus.name} error:\n{str(e)}')
+
+    def stats(self):
+        # Health and frame rate since the previous call, like MultiPortAcquisition.stats()
+        now = time.monotonic()
+        framesPerSecond = (self.frameCount - self.lastFrameCount) / max(now - self.lastStatsClock, 1e-9)
+        self.lastStatsClock = now
+        self.lastFrameCount = self.frameCount
+        if self.error is not None:
+            health = 'error'
+        elif now - self.lastFrameClock > self.stallTimeout:
+            health = 'stalled'
+        else:
+            health = 'ok'
+        return {'bus': self.bus.name, 'health': health, 'framesPerSecond': framesPerSecond,
+                'frames': self.frameCount, 'lostFrames': self.lostFrameCount, 'error': self.error}
@@ -0,0 +1,181 @@
+import struct
+import zlib
+
+import numpy as np
+
+# Binary frame: sync, payload length (uint16), numBlock little-endian samples, CRC-32 of the payload (uint32)
+binarySync = b'\xaa\x55'
+binaryHeader = struct.Struct('<2sH')
+binaryCrc = struct.Struct('<I')
+binarySampleTypes = {'int16': '<i2', 'uint16': '<u2', 'float32': '<f4'}
+
+
+class AsciiFrameParser:
+    # Turns raw serial bytes into frames of numBlock values.
+    # Rows are text lines of numbers split by separationBetweenNumbers, and when there is more than one row
+    # a line starting with separationBetweenRows ends every frame. Bytes can be fed in chunks of any size,
+    # an unfinished line is kept until the rest of it arrives.
+    def __init__(self, blockRow, numBlock, separationBetweenRows, separationBetweenNumbers):
+        self.blockRow = blockRow
+        self.numBlock = numBlock
+        self.separationBetweenRows = separationBetweenRows
+        self.separationBetweenNumbers = bytes([separationBetweenNumbers])
+        self.stripChars = b' \t\r' + self.separationBetweenNumbers
+
+        self.pending = b''
+        self.rows = []
+        self.synced = False
+
+        self.frameCount = 0
+        self.malformedFrameCount = 0
+        self.partialFrameCount = 0
+        self.discardedByteCount = 0
+
+    def reset(self):
+        self.pending = b''
+        self.rows = []
+        self.synced = False
+
+    def feed(self, data):
+        self.pending += data
+        lines = self.pending.split(b'\n')
+        self.pending = lines.pop()
+
+        frames = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+
+            if not self.synced:
+                # The first line may have been cut in half when the port was opened, so a single row device
+                # starts at the next full line and a multi row device at the next row separator
+                self.discardedByteCount += len(line) + 1
+                if self.blockRow == 1 or line[0] == self.separationBetweenRows:
+                    self.synced = True
+                continue
+
+            if self.blockRow == 1:
+                self.appendFrame(frames, [line])
+                continue
+
+            if len(self.rows) == self.blockRow:
+                if line[0] == self.separationBetweenRows:
+                    self.appendFrame(frames, self.rows)
+                else:
+                    # Too many rows, the separator was lost, wait for the next one
+                    self.malformedFrameCount += 1
+                    self.discardedByteCount += sum(len(row) + 1 for row in self.rows) + len(line) + 1
+                    self.synced = False
+                self.rows = []
+            elif self.isSeparator(line):
+                if self.rows:
+                    self.partialFrameCount += 1
+                    self.discardedByteCount += sum(len(row) + 1 for row in self.rows)
+                    self.rows = []
+            else:
+                self.rows.append(line)
+
+        return frames
+
+    def isSeparator(self, line):
+        return line.strip(bytes([self.separationBetweenRows])) == b''
+
+    def appendFrame(self, frames, rows):
+        frame = self.parseRows(rows)
+        if frame is None:
+            self.malformedFrameCount += 1
+            self.discardedByteCount += sum(len(row) + 1 for row in rows)
+        else:
+            self.frameCount += 1
+            frames.append(frame)
+
+    def parseRows(self, rows):
+        # All rows of a frame are converted by NumPy in one call
+        text = self.separationBetweenNumbers.join(row.strip(self.stripChars) for row in rows)
+        tokens = text.split(self.separationBetweenNumbers)
+        try:
+            frame = np.array(tokens).astype(np.float64)
+        except ValueError:
+            tokens = [token for token in tokens if token.strip()]
+            try:
+                frame = np.array(tokens).astype(np.float64)
+            except ValueError:
+                return None
+        if frame.size != self.numBlock:
+            return None
+        return frame
+
+
+class BinaryFrameParser:
+    # Same interface as AsciiFrameParser for the binary frame format described at the top of this file
+    def __init__(self, numBlock, sampleType):
+        self.numBlock = numBlock
+        self.dtype = np.dtype(binarySampleTypes[sampleType])
+        self.payloadLength = numBlock * self.dtype.itemsize
+
+        self.buffer = bytearray()
+        self.synced = False
+
+        self.frameCount = 0
+        self.malformedFrameCount = 0
+        self.partialFrameCount = 0
+        self.discardedByteCount = 0
+
+    def reset(self):
+        self.buffer = bytearray()
+        self.synced = False
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        position = 0
+        with memoryview(self.buffer) as view:
+            while True:
+                start = self.buffer.find(binarySync, position)
+                if start == -1:
+                    # Keep the last byte, it may be the first half of the next sync
+                    end = max(position, len(self.buffer) - 1)
+                    self.discardedByteCount += end - position
+                    position = end
+                    break
+                self.discardedByteCount += start - position
+                position = start
+                if len(self.buffer) - start < binaryHeader.size:
+                    break
+
+                _, payloadLength = binaryHeader.unpack_from(view, start)
+                if payloadLength != self.payloadLength:
+                    self.malformedFrameCount += 1
+                    self.discardedByteCount += 1
+                    position = start + 1
+                    continue
+                payloadStart = start + binaryHeader.size
+                end = payloadStart + payloadLength + binaryCrc.size
+                if len(self.buffer) < end:
+                    break
+
+                crc, = binaryCrc.unpack_from(view, payloadStart + payloadLength)
+                if zlib.crc32(view[payloadStart:payloadStart + payloadLength]) != crc:
+                    # A sync inside the frame means it was cut short and the next frame already started
+                    if self.buffer.find(binarySync, payloadStart, end) != -1:
+                        self.partialFrameCount += 1
+                    else:
+                        self.malformedFrameCount += 1
+                    self.discardedByteCount += 1
+                    position = start + 1
+                    continue
+
+                # Decoded straight from the receive buffer, the only copy is the conversion to float64
+                frames.append(np.frombuffer(view, self.dtype, self.numBlock, payloadStart).astype(np.float64))
+                self.frameCount += 1
+                self.synced = True
+                position = end
+
+        del self.buffer[:position]
+        return frames
+
+
+def encodeBinaryFrame(values, sampleType):
+    payload = np.asarray(values).astype(binarySampleTypes[sampleType]).tobytes()
+    return binaryHeader.pack(binarySync, len(payload)) + payload + binaryCrc.pack(zlib.crc32(payload))
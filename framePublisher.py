@@ -0,0 +1,202 @@
+import time
+import socket
+import struct
+import argparse
+import threading
+
+import numpy as np
+
+from frameQueue import FrameQueue
+
+# Live frames for other programs on the same machine or network, over plain TCP. A subscriber first gets a
+# header: magic, version, numBlock. Then every frame is a record of uint64 sequence number, int64 timestamp in ns
+# and numBlock float32 values, all little-endian. Sequence numbers count every frame published, so a gap means
+# the subscriber's buffer overflowed and frames were skipped for it.
+publisherMagic = b'STCF'
+publisherHeader = struct.Struct('<4sHI')
+recordHeader = struct.Struct('<Qq')
+# What happens to a subscriber whose buffer is full: the oldest frames are dropped, only the newest frame is
+# kept, or the subscriber is disconnected
+publisherPolicies = ['dropOldest', 'coalesce', 'disconnect']
+
+
+def encodeFrame(sequence, timestamp, frame):
+    return recordHeader.pack(sequence, timestamp) + np.asarray(frame, dtype='<f4').tobytes()
+
+
+class Subscriber:
+    # One connected client, frames queue up in its own bounded buffer and a thread sends them. A client that
+    # takes nothing for sendTimeout seconds is disconnected whatever the policy
+    sendTimeout = 5.0
+
+    def __init__(self, connection, address, queueLength, policy):
+        self.connection = connection
+        self.connection.settimeout(self.sendTimeout)
+        self.address = address
+        self.policy = policy
+        self.queue = FrameQueue(queueLength, 'dropOldest' if policy == 'disconnect' else policy)
+        self.running = True
+        self.sentFrameCount = 0
+        self.thread = threading.Thread(target=self.run, name=f'Subscriber {address[0]}:{address[1]}', daemon=True)
+
+    @property
+    def droppedFrameCount(self):
+        return self.queue.droppedCount + self.queue.coalescedCount
+
+    def put(self, record):
+        # False when the subscriber is too slow and has to go
+        if self.policy == 'disconnect' and len(self.queue) >= self.queue.capacity:
+            self.running = False
+            return False
+        self.queue.put(record)
+        return True
+
+    def run(self):
+        try:
+            while self.running:
+                batch = self.queue.getBatch(timeout=0.1)
+                if batch:
+                    self.connection.sendall(b''.join(batch))
+                    self.sentFrameCount += len(batch)
+        except ConnectionError:
+            print(f'Subscriber {self.address[0]}:{self.address[1]} disconnected.')
+        except OSError as e:
+            print(f'Subscriber {self.address[0]}:{self.address[1]} error:\n{str(e)}')
+        self.running = False
+        self.connection.close()
+
+
+class FramePublisher:
+    # Accepts subscribers on host:port and hands every published frame to all of them. publish() only encodes
+    # the frame once and queues it, so a slow or stuck subscriber never holds back the caller
+    def __init__(self, numBlock, host='127.0.0.1', port=5555, queueLength=64, policy='dropOldest'):
+        if policy not in publisherPolicies:
+            raise ValueError(f'Unknown publisher policy {policy}')
+        self.numBlock = numBlock
+        self.queueLength = queueLength
+        self.policy = policy
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.disconnectedCount = 0
+        self.server = socket.create_server((host, port))
+        self.server.settimeout(0.1)
+        self.address = self.server.getsockname()[:2]
+        self.running = False
+        self.thread = threading.Thread(target=self.run, name=f'FramePublisher {host}:{port}', daemon=True)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join()
+        self.server.close()
+        with self.lock:
+            subscribers, self.subscribers = self.subscribers, []
+        for subscriber in subscribers:
+            subscriber.running = False
+            try:
+                # Wakes a sender stuck on a full socket
+                subscriber.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            subscriber.thread.join()
+
+    def run(self):
+        while self.running:
+            try:
+                connection, address = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError as e:
+                print(f'FramePublisher error:\n{str(e)}')
+                break
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                connection.sendall(publisherHeader.pack(publisherMagic, 1, self.numBlock))
+            except OSError:
+                connection.close()
+                continue
+            subscriber = Subscriber(connection, address, self.queueLength, self.policy)
+            subscriber.thread.start()
+            with self.lock:
+                self.subscribers = self.subscribers + [subscriber]
+            print(f'Subscriber {address[0]}:{address[1]} connected.')
+
+    def publish(self, timestamp, frame):
+        record = encodeFrame(self.sequence, timestamp, frame)
+        self.sequence += 1
+        with self.lock:
+            subscribers = self.subscribers
+            if not all(subscriber.running for subscriber in subscribers):
+                subscribers = self.subscribers = [_ for _ in subscribers if _.running]
+        for subscriber in subscribers:
+            if not subscriber.put(record):
+                self.disconnectedCount += 1
+                print(f'Subscriber {subscriber.address[0]}:{subscriber.address[1]} is too slow, disconnected.')
+
+    def stats(self):
+        with self.lock:
+            return [{'address': f'{_.address[0]}:{_.address[1]}', 'sent': _.sentFrameCount,
+                     'dropped': _.droppedFrameCount, 'queued': len(_.queue)} for _ in self.subscribers if _.running]
+
+
+class FrameSubscriber:
+    # Client side of FramePublisher: frames() yields (sequence, timestamp, values) until the publisher goes away
+    def __init__(self, host='127.0.0.1', port=5555, timeout=None):
+        self.connection = socket.create_connection((host, port), timeout)
+        magic, version, self.numBlock = publisherHeader.unpack(self.receive(publisherHeader.size))
+        if magic != publisherMagic:
+            raise ValueError(f'{host}:{port} is not a frame publisher')
+        self.recordSize = recordHeader.size + 4 * self.numBlock
+
+    def receive(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.connection.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('Publisher closed the connection')
+            data += chunk
+        return bytes(data)
+
+    def frames(self):
+        while True:
+            try:
+                record = self.receive(self.recordSize)
+            except ConnectionError:
+                return
+            sequence, timestamp = recordHeader.unpack_from(record)
+            yield sequence, timestamp, np.frombuffer(record, dtype='<f4', offset=recordHeader.size)
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == '__main__':
+    # Loopback check of a running publisher: prints the frame rate and the frames skipped for this subscriber
+    parser = argparse.ArgumentParser(description='Subscribe to the live frames of a running publisher')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5555)
+    args = parser.parse_args()
+
+    subscriber = FrameSubscriber(args.host, args.port)
+    print(f'Connected, {subscriber.numBlock} blocks')
+    frameCount = skippedCount = 0
+    lastSequence = None
+    lastPrint = time.monotonic()
+    try:
+        for sequence, timestamp, values in subscriber.frames():
+            if lastSequence is not None:
+                skippedCount += sequence - lastSequence - 1
+            lastSequence = sequence
+            frameCount += 1
+            if time.monotonic() - lastPrint >= 1:
+                lastPrint = time.monotonic()
+                print(f'Frame {sequence}: {frameCount} received, {skippedCount} skipped, '
+                      f'latency {(time.time_ns() - timestamp) / 1e6:.1f} ms', flush=True)
+    except KeyboardInterrupt:
+        pass
+    subscriber.close()
@@ -0,0 +1,66 @@
+import time
+import threading
+import collections
+
+queuePolicies = ['block', 'dropOldest', 'coalesce']
+
+
+class FrameQueue:
+    # Bounded hand-off between a producer and a consumer thread. When it is full:
+    #   block       put() waits for room, holding back the producer, and drops the item after blockTimeout
+    #   dropOldest  the oldest item is thrown away
+    #   coalesce    the newest item is replaced, with capacity 1 the consumer only ever sees the latest value
+    def __init__(self, capacity, policy='dropOldest', blockTimeout=1.0):
+        if policy not in queuePolicies:
+            raise ValueError(f'Unknown queue policy {policy}')
+        self.capacity = capacity
+        self.policy = policy
+        self.blockTimeout = blockTimeout
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.putCount = 0
+        self.droppedCount = 0
+        self.coalescedCount = 0
+        self.blockedSeconds = 0.0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        # False when the item was dropped
+        with self.condition:
+            self.putCount += 1
+            if len(self.items) >= self.capacity:
+                if self.policy == 'block':
+                    blockStart = time.perf_counter()
+                    hasRoom = self.condition.wait_for(lambda: len(self.items) < self.capacity, self.blockTimeout)
+                    self.blockedSeconds += time.perf_counter() - blockStart
+                    if not hasRoom:
+                        self.droppedCount += 1
+                        return False
+                elif self.policy == 'dropOldest':
+                    self.items.popleft()
+                    self.droppedCount += 1
+                else:
+                    self.items[-1] = item
+                    self.coalescedCount += 1
+                    return True
+            self.items.append(item)
+            self.condition.notify_all()
+            return True
+
+    def getBatch(self, maxItems=None, timeout=None):
+        # Everything queued (at most maxItems), after waiting up to timeout for the first item. Empty on timeout
+        with self.condition:
+            if not self.items and timeout != 0:
+                self.condition.wait_for(lambda: self.items, timeout)
+            count = len(self.items) if maxItems is None else min(maxItems, len(self.items))
+            batch = [self.items.popleft() for _ in range(count)]
+            if batch:
+                self.condition.notify_all()
+            return batch
+
+    def clear(self):
+        with self.condition:
+            self.items.clear()
+            self.condition.notify_all()
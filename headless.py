@@ -0,0 +1,278 @@
+import os
+import sys
+import time
+import signal
+import argparse
+import datetime
+import threading
+import configparser
+
+from recorder import Recorder, recordingSinks
+from simulatedSerial import simulatorPort
+from multiPort import MultiPortAcquisition, parsePortRegions
+from metrics import metrics
+from serialTransport import portSettings, lineRate
+from frameBus import FrameBus, BusReader
+from framePublisher import FramePublisher
+from alarmEngine import AlarmEngine, parseAlarmRules
+from roi import RoiAggregator, RoiSink, parseRois
+from acquisitionSetup import loadAcquisitionSetup, setRecorderMetrics
+
+# Unattended logging without Qt: frames are read with the settings of config.ini and go straight to a recording
+# sink. The reader threads block on their ports and the main thread only wakes up for statistics and signals.
+# The same code runs in the processes the GUI starts to read ports and record away from its own interpreter,
+# they hand frames over through a FrameBus.
+
+
+def log(message):
+    print(f'{datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")} {message}', flush=True)
+
+
+class HeadlessLogger:
+    def __init__(self, config, port=None, recordFormat=None, output='data', metricsPath=None, busName=None,
+                 publishAddress=None):
+        self.blockRow = int(config.get('Display', 'blockRow'))
+        self.blockColumn = int(config.get('Display', 'blockColumn'))
+        self.numBlock = self.blockRow * self.blockColumn
+        # Ports and parsers are built the same way as in the GUI
+        self.setup = loadAcquisitionSetup(config)
+        self.maxDataNum = int(config.get('Data', 'maxData'))
+        self.minDataNum = int(config.get('Data', 'minData'))
+        self.recordFormat = recordFormat or config.get('Data', 'record_format', fallback='csv')
+        self.recordPolicy = config.get('Data', 'record_policy', fallback='dropOldest')
+        self.syncInterval = float(config.get('Data', 'sync_interval', fallback='1'))
+        self.frameBufferLength = int(config.get('Data', 'frame_buffer_length', fallback='10000'))
+        self.header = {'blockRow': self.blockRow, 'blockColumn': self.blockColumn, 'maxData': self.maxDataNum,
+                       'minData': self.minDataNum}
+        for key in ('startColor', 'intervalColor', 'endColor'):
+            self.header[key] = list(map(int, config.get('Color', key).split()))
+        self.header['gradient'] = config.get('Color', 'gradient', fallback='Custom')
+
+        # One port fills the whole grid, otherwise the regions of config.ini are read together. With busName
+        # frames are recorded from the FrameBus another process writes instead of being read from ports
+        self.busName = busName
+        # Frame of the bus recording starts at, None for the next one written
+        self.busCursor = None
+        if busName is not None:
+            self.regions = []
+        elif port is not None:
+            self.regions = [(port, 0, 0, self.blockRow, self.blockColumn)]
+        else:
+            self.regions = parsePortRegions(config.get('Ports', 'regions', fallback=''))
+            if not self.regions:
+                raise ValueError('No port given and no [Ports] regions in config.ini')
+        self.maxSkew = float(config.get('Ports', 'max_skew', fallback='0.05'))
+        self.output = output
+        self.metricsPath = metricsPath or config.get('Metrics', 'path', fallback='')
+        # Recorded frames are also streamed to TCP subscribers on publishAddress (host:port) when it is given
+        self.publishAddress = publishAddress
+        self.publisherQueueLength = int(config.get('Publisher', 'queue_length', fallback='64'))
+        self.publisherPolicy = config.get('Publisher', 'policy', fallback='dropOldest')
+        self.publisher = None
+        # Alarm events go to a log beside the recordings
+        self.alarmRules = parseAlarmRules(config.get('Alarms', 'rules', fallback=''))
+        self.alarmLogName = os.path.basename(config.get('Alarms', 'log', fallback='data/alarms.csv'))
+        self.alarmEngine = None
+        # ROI aggregates are recorded beside the frames
+        self.rois = parseRois(config.get('ROI', 'regions', fallback=''))
+        self.stopEvent = threading.Event()
+        self.recorder = None
+        self.source = None
+
+    def createSource(self, callback):
+        if self.busName is not None:
+            bus = FrameBus(self.busName)
+            if bus.numBlock != self.numBlock:
+                bus.close()
+                raise ValueError(f'Bus {self.busName} carries {bus.numBlock} blocks, not {self.numBlock}')
+            return BusReader(bus, callback, self.busCursor)
+        return MultiPortAcquisition(self.regions, self.blockRow, self.blockColumn, self.setup.createPort,
+                                    self.setup.createParser, callback, self.maxSkew, self.setup.openPort)
+
+    def createRecorder(self):
+        os.makedirs(self.output, exist_ok=True)
+        startTime = datetime.datetime.now().strftime('%Y-%m-%d %H.%M.%S')
+        sink = recordingSinks[self.recordFormat]
+        path = os.path.join(self.output, f'totalData {startTime}.{sink.extension}')
+        if self.recordFormat == 'session':
+            sink = sink(path, self.numBlock, dict(self.header, startTime=startTime))
+        else:
+            sink = sink(path, self.numBlock)
+        log(f'Recording to {path}')
+        sinks = [sink]
+        if self.rois:
+            try:
+                roiAggregator = RoiAggregator(self.rois, self.blockRow, self.blockColumn)
+            except ValueError as e:
+                # Like the GUI, ROIs that do not fit the grid are left out instead of stopping the recording
+                log(f'ROIs not used: {str(e)}')
+            else:
+                sinks.append(RoiSink(os.path.join(self.output, f'totalData {startTime}.{RoiSink.extension}'),
+                                     roiAggregator))
+        return Recorder(sinks, self.syncInterval, self.frameBufferLength, self.recordPolicy)
+
+    def handleFrame(self, timestamp, frame):
+        self.recorder.put(timestamp, frame)
+        if self.publisher is not None:
+            self.publisher.publish(timestamp, frame)
+        if self.alarmEngine is not None:
+            self.alarmEngine.put(timestamp, frame)
+
+    def stop(self, signum=None, frame=None):
+        self.stopEvent.set()
+
+    def logBusStats(self):
+        stats = self.source.stats()
+        metrics.set('framesPerSecond', round(stats['framesPerSecond'], 1), bus=stats['bus'])
+        metrics.set('busLostFrames', stats['lostFrames'], bus=stats['bus'])
+        log(f'{stats["bus"]}: {stats["health"]}, {stats["framesPerSecond"]:.1f} frames/s, '
+            f'frames: {stats["frames"]}, lost: {stats["lostFrames"]}')
+
+    def logPortStats(self):
+        for stats in self.source.stats():
+            metrics.set('framesPerSecond', round(stats['framesPerSecond'], 1), port=stats['port'])
+            metrics.set('malformedFrames', stats['malformedFrames'], port=stats['port'])
+            metrics.set('staleFrames', stats['staleFrames'], port=stats['port'])
+            portLineRate = lineRate(portSettings(self.setup.serialSettings, stats['port']))
+            metrics.set('serialBytesPerSecond', round(stats['bytesPerSecond'], 1), port=stats['port'])
+            metrics.set('serialLineRateBytesPerSecond', round(portLineRate, 1), port=stats['port'])
+            log(f'{stats["port"]}: {stats["health"]}, {stats["framesPerSecond"]:.1f} frames/s, '
+                f'{stats["bytesPerSecond"] / 1024:.1f} of {portLineRate / 1024:.1f} KiB/s, frames: {stats["frames"]}, '
+                f'malformed: {stats["malformedFrames"]}, stale: {stats["staleFrames"]}')
+
+    def logStats(self):
+        if self.busName is not None:
+            self.logBusStats()
+        else:
+            self.logPortStats()
+        log(f'Recorded: {self.recorder.writtenFrameCount}, dropped: {self.recorder.droppedFrameCount}, '
+            f'queued: {len(self.recorder.queue)}'
+            + (f', error: {self.recorder.error}' if self.recorder.error is not None else ''))
+        if self.alarmEngine is not None:
+            metrics.set('alarmsActive', int(self.alarmEngine.active.sum()))
+            metrics.set('alarmDroppedFrames', self.alarmEngine.droppedFrameCount)
+            log(f'Alarms active: {int(self.alarmEngine.active.sum())}, events: {self.alarmEngine.eventCount}, '
+                f'frames not checked: {self.alarmEngine.droppedFrameCount}')
+        if self.publisher is not None:
+            subscribers = self.publisher.stats()
+            metrics.set('publisherSubscribers', len(subscribers))
+            metrics.set('publisherDisconnectedSubscribers', self.publisher.disconnectedCount)
+            log(f'Subscribers: {len(subscribers)}, frames skipped for them: '
+                f'{sum(_["dropped"] for _ in subscribers)}, disconnected: {self.publisher.disconnectedCount}')
+        setRecorderMetrics(self.recorder)
+        if self.metricsPath:
+            metrics.dump(self.metricsPath)
+
+    def run(self, statsInterval=10.0, duration=None):
+        self.recorder = self.createRecorder()
+        self.source = self.createSource(self.handleFrame)
+        if self.publishAddress is not None:
+            host, port = self.publishAddress.rsplit(':', 1)
+            self.publisher = FramePublisher(self.numBlock, host, int(port), self.publisherQueueLength,
+                                            self.publisherPolicy)
+            self.publisher.start()
+            log(f'Publishing frames on {self.publishAddress}')
+        if self.alarmRules:
+            try:
+                self.alarmEngine = AlarmEngine(self.alarmRules, self.blockRow, self.blockColumn,
+                                               os.path.join(self.output, self.alarmLogName), self.frameBufferLength)
+                self.alarmEngine.start()
+            except ValueError as e:
+                log(f'Alarm rules not used: {str(e)}')
+        self.recorder.start()
+        self.source.start()
+        if self.busName is not None:
+            log(f'Logging bus {self.busName}, {self.numBlock} blocks')
+        else:
+            log(f'Logging {len(self.regions)} port(s), {self.numBlock} blocks, {self.setup.protocol}')
+
+        deadline = time.monotonic() + duration if duration is not None else None
+        try:
+            while True:
+                timeout = statsInterval if deadline is None else min(statsInterval, deadline - time.monotonic())
+                if self.stopEvent.wait(max(timeout, 0)):
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                self.logStats()
+                if self.recorder.error is not None:
+                    log('Recording failed, stopping')
+                    break
+        finally:
+            # Readers first so nothing is queued after the recorder has drained and synced its files
+            self.source.stop()
+            self.recorder.stop()
+            if self.alarmEngine is not None:
+                self.alarmEngine.stop()
+            self.logStats()
+            if self.publisher is not None:
+                self.publisher.stop()
+            if self.busName is not None:
+                self.source.bus.close()
+            log('Stopped')
+
+
+def publishToBus(configText, port, busName, stopEvent):
+    # Target of the process the GUI reads ports in: the frames of port, or of the [Ports] regions when port is
+    # None, are written to the FrameBus busName until stopEvent is set
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C is for the GUI, which stops this process
+    config = configparser.ConfigParser()
+    config.read_string(configText)
+    logger = HeadlessLogger(config, port)
+    bus = FrameBus(busName)
+    acquisition = logger.createSource(bus.write)
+    acquisition.start()
+    try:
+        stopEvent.wait()
+    finally:
+        acquisition.stop()
+        for stats in acquisition.stats():
+            log(f'{stats["port"]}: {stats["health"]}, frames: {stats["frames"]}, '
+                f'malformed: {stats["malformedFrames"]}, stale: {stats["staleFrames"]}'
+                + (f', error: {stats["error"]}' if stats['error'] else ''))
+        bus.close()
+
+
+def recordFromBus(configText, busName, output, stopEvent, statsInterval=10.0):
+    # Target of the process the GUI records in, it stops once stopEvent is set and every frame on the bus is
+    # written
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    config = configparser.ConfigParser()
+    config.read_string(configText)
+    logger = HeadlessLogger(config, output=output, busName=busName)
+    logger.stopEvent = stopEvent
+    # Alarms are checked by the GUI, which shows them
+    logger.alarmRules = []
+    # The bus is new, starting at its first frame keeps the frames written before this process attached
+    logger.busCursor = 0
+    logger.run(statsInterval)
+    if logger.recorder.error is not None:
+        # Shown by the GUI as the exit code of the recording process
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record frames from serial ports without the GUI')
+    parser.add_argument('--port', help=f'serial port for the whole grid, or {simulatorPort}; '
+                                       f'the [Ports] regions of the config are used when omitted')
+    parser.add_argument('--bus', help='record from the frame bus of this name, written by a GUI that reads '
+                                      'ports in a separate process, instead of from ports')
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--format', choices=list(recordingSinks), help='record format, from the config when omitted')
+    parser.add_argument('--output', default='data', help='directory for the recordings')
+    parser.add_argument('--statsInterval', type=float, default=10.0, help='seconds between statistics lines')
+    parser.add_argument('--metrics', help='file the metrics are written to with every statistics line, '
+                                          '.prom for Prometheus text, JSON otherwise')
+    parser.add_argument('--publish', metavar='HOST:PORT', help='also stream the frames to TCP subscribers, '
+                                                             'see framePublisher')
+    parser.add_argument('--duration', type=float, help='stop after this many seconds')
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    logger = HeadlessLogger(config, args.port, args.format, args.output, args.metrics, args.bus, args.publish)
+    signal.signal(signal.SIGINT, logger.stop)
+    signal.signal(signal.SIGTERM, logger.stop)
+    logger.run(args.statsInterval, args.duration)
+    if logger.recorder.error is not None:
+        sys.exit(1)
@@ -1,12 +1,30 @@
-import sys
+import time
+startClock = time.perf_counter()
 
-import UI
-from PySide6.QtWidgets import QApplication
-from PySide6.QtCore import QTranslator
-from PySide6.QtGui import QIcon
+import sys
 import configparser
 
+# Seconds from launch until the event loop is running with the window shown, checked by --startup-time
+startupBudget = 1.0
+
+
+def reportStartup():
+    startupTime = time.perf_counter() - startClock
+    print(f'Startup: {startupTime:.3f} s (imports {importTime:.3f} s), budget {startupBudget:.3f} s'
+          + (', over budget' if startupTime > startupBudget else ''))
+    QApplication.quit()
+
+
 if __name__ == '__main__':
+    # The frame bus processes are spawned and import this module again as __mp_main__, the GUI and Qt are only
+    # imported here so they stay out of those processes
+    import UI
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtCore import QTranslator, QTimer
+    from PySide6.QtGui import QIcon
+
+    importTime = time.perf_counter() - startClock
+
     config = configparser.ConfigParser()
     config.read('config.ini')
     language = config.get('General', 'language')
@@ -22,4 +40,7 @@ if __name__ == '__main__':
     window = UI.MainWindow()
 
     window.show()
+    if '--startup-time' in sys.argv:
+        # Runs once the first events after show() have been processed
+        QTimer.singleShot(0, reportStartup)
     app.exec()
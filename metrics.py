@@ -0,0 +1,119 @@
+import os
+import json
+import bisect
+import threading
+
+# Counters, gauges and histograms of the acquisition pipeline, shared by the GUI and headless mode. Hot paths
+# only add to a counter or a histogram bucket, totals owned by other objects (parser and recorder counters)
+# are copied in as gauges when a snapshot is taken.
+
+
+class Histogram:
+    # Cumulative counts below fixed upper bounds in seconds, like a Prometheus histogram
+    bounds = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self):
+        self.counts = [0 for _ in range(len(self.bounds) + 1)]
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q quantile, inf when it is above the last bound
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float('inf')
+
+
+def metricKey(name, labels):
+    return name + ('{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+                   if labels else '')
+
+
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def increment(self, name, value=1, **labels):
+        key = metricKey(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.gauges[metricKey(name, labels)] = value
+
+    def remove(self, name, **labels):
+        self.gauges.pop(metricKey(name, labels), None)
+
+    def observe(self, name, value, **labels):
+        key = metricKey(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def counter(self, name, **labels):
+        return self.counters.get(metricKey(name, labels), 0)
+
+    def histogram(self, name, **labels):
+        return self.histograms.get(metricKey(name, labels)) or Histogram()
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        with self.lock:
+            return {'counters': dict(self.counters), 'gauges': dict(self.gauges),
+                    'histograms': {key: {'count': _.count, 'sum': _.sum, 'p50': _.quantile(0.5),
+                                         'p99': _.quantile(0.99)} for key, _ in self.histograms.items()}}
+
+    def toJson(self):
+        return json.dumps(self.snapshot(), indent=4)
+
+    def toPrometheus(self, prefix='showcolor_'):
+        lines = []
+        with self.lock:
+            for key, value in sorted(self.counters.items()):
+                lines.append(f'{prefix}{key} {value}')
+            for key, value in sorted(self.gauges.items()):
+                lines.append(f'{prefix}{key} {value}')
+            for key, histogram in sorted(self.histograms.items()):
+                name, _, labels = key.partition('{')
+                labels = labels.rstrip('}')
+                separator = ',' if labels else ''
+                total = 0
+                for bound, count in zip(histogram.bounds + ('+Inf',), histogram.counts):
+                    total += count
+                    lines.append(f'{prefix}{name}_bucket{{{labels}{separator}le="{bound}"}} {total}')
+                suffix = f'{{{labels}}}' if labels else ''
+                lines.append(f'{prefix}{name}_sum{suffix} {histogram.sum}')
+                lines.append(f'{prefix}{name}_count{suffix} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        # Prometheus text for .prom files, JSON otherwise. Written beside the target and renamed so a reader
+        # never sees half a file
+        text = self.toPrometheus() if path.endswith('.prom') else self.toJson()
+        with open(path + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+
+metrics = Metrics()
@@ -0,0 +1,187 @@
+import threading
+import time
+
+import numpy as np
+
+from metrics import metrics
+
+multiPortName = 'multiple'
+
+
+def parsePortRegions(text):
+    # 'port row column rows columns; ...' -> [(port, row, column, rows, columns), ...]
+    regions = []
+    for entry in text.split(';'):
+        if not entry.strip():
+            continue
+        fields = entry.split()
+        if len(fields) != 5:
+            raise ValueError(f'Port region "{entry.strip()}" is not "port row column rows columns"')
+        regions.append((fields[0],) + tuple(int(_) for _ in fields[1:]))
+    return regions
+
+
+def formatPortRegions(regions):
+    return '; '.join(' '.join(str(_) for _ in region) for region in regions)
+
+
+def regionIndex(region, blockRow, blockColumn):
+    # Positions of the region's values in a row-major grid frame
+    port, row, column, rows, columns = region
+    if rows < 1 or columns < 1 or row < 0 or column < 0 or row + rows > blockRow or column + columns > blockColumn:
+        raise ValueError(f'Region of {port} does not fit in the {blockRow} x {blockColumn} grid')
+    return ((np.arange(row, row + rows) * blockColumn)[:, np.newaxis] + np.arange(column, column + columns)).ravel()
+
+
+class FrameMerger:
+    # Combines the latest frame of every port into one grid frame. A frame goes out once every port has a new
+    # one, or as soon as a port delivers again or the oldest new frame is maxSkew seconds old, so a slow or
+    # dead port only leaves its region stale instead of holding back the others
+    def __init__(self, numBlock, blockRow, blockColumn, regions, callback, maxSkew=0.05):
+        self.index = [regionIndex(_, blockRow, blockColumn) for _ in regions]
+        covered = np.concatenate(self.index)
+        if len(np.unique(covered)) != len(covered):
+            raise ValueError('Port regions overlap')
+        self.callback = callback
+        self.maxSkew = int(maxSkew * 1e9)
+        # NaN until the port of a region delivers its first frame
+        self.frame = np.full(numBlock, np.nan)
+        self.fresh = np.zeros(len(regions), dtype=bool)
+        self.freshTime = np.zeros(len(regions), dtype=np.int64)
+        self.staleFrameCount = [0 for _ in regions]
+        self.mergedFrameCount = 0
+        self.lock = threading.Lock()
+
+    def put(self, portIndex, timestamp, values):
+        with self.lock:
+            if self.fresh[portIndex]:
+                self.emit()
+            self.frame[self.index[portIndex]] = values
+            self.fresh[portIndex] = True
+            self.freshTime[portIndex] = timestamp
+            if self.fresh.all() or timestamp - self.freshTime[self.fresh].min() >= self.maxSkew:
+                self.emit()
+
+    def poll(self, now):
+        # Called by idle readers so a frame waiting for a dead port still goes out
+        with self.lock:
+            if self.fresh.any() and now - self.freshTime[self.fresh].min() >= self.maxSkew:
+                self.emit()
+
+    def emit(self):
+        for _ in np.flatnonzero(~self.fresh):
+            self.staleFrameCount[_] += 1
+        self.callback(int(self.freshTime[self.fresh].max()), self.frame.copy())
+        self.fresh[:] = False
+        self.mergedFrameCount += 1
+
+
+class PortReader:
+    # Reads and parses one port on its own thread, an error stops only this port
+    def __init__(self, portIndex, port, parser, merger, openPort=None):
+        self.portIndex = portIndex
+        self.port = port
+        self.openPort = openPort
+        self.parser = parser
+        self.merger = merger
+        self.running = False
+        self.error = None
+        self.byteCount = 0
+        self.lastFrameClock = 0
+        self.thread = threading.Thread(target=self.run, name=f'PortReader {port.port}', daemon=True)
+
+    def start(self):
+        self.running = True
+        self.lastFrameClock = time.monotonic()
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join()
+        if self.port.is_open:
+            self.port.close()
+
+    def run(self):
+        try:
+            if not self.port.is_open:
+                if self.openPort is not None:
+                    self.openPort(self.port)
+                else:
+                    self.port.open()
+            while self.running:
+                waiting = self.port.in_waiting
+                readStart = time.perf_counter()
+                currentData = self.port.read(waiting or 1)
+                if waiting:
+                    # Only reads of buffered bytes, a read that waits for the next byte would time the wait
+                    metrics.observe('serialReadSeconds', time.perf_counter() - readStart, port=self.port.port)
+                if not currentData:
+                    self.merger.poll(time.time_ns())
+                    continue
+                self.byteCount += len(currentData)
+                metrics.increment('bytesReceived', len(currentData), port=self.port.port)
+                currentTime = time.time_ns()
+                parseStart = time.perf_counter()
+                currentFrames = self.parser.feed(currentData)
+                metrics.observe('parseSeconds', time.perf_counter() - parseStart, port=self.port.port)
+                metrics.increment('framesParsed', len(currentFrames), port=self.port.port)
+                for currentFrame in currentFrames:
+                    self.merger.put(self.portIndex, currentTime, currentFrame)
+                    self.lastFrameClock = time.monotonic()
+        except BaseException as e:
+            self.error = str(e)
+            print(f'PortReader {self.port.port} error:\n{str(e)}')
+
+
+class MultiPortAcquisition:
+    # One PortReader per region, their frames are merged into whole grid frames passed to callback.
+    # createPort(name, rows, columns) returns a closed serial-like port and createParser(rows, columns) a parser
+    # for one region. openPort(port), when given, opens a port on its reader thread instead of port.open(), so
+    # settings like the receive buffer size can be applied
+    stallTimeout = 1.0
+
+    def __init__(self, regions, blockRow, blockColumn, createPort, createParser, callback, maxSkew=0.05,
+                 openPort=None):
+        self.regions = regions
+        self.merger = FrameMerger(blockRow * blockColumn, blockRow, blockColumn, regions, callback, maxSkew)
+        self.readers = []
+        for portIndex, (name, _, _, rows, columns) in enumerate(regions):
+            self.readers.append(PortReader(portIndex, createPort(name, rows, columns), createParser(rows, columns),
+                                           self.merger, openPort))
+        self.lastStatsClock = time.monotonic()
+        self.lastCounts = [(0, 0) for _ in regions]
+
+    def start(self):
+        self.lastStatsClock = time.monotonic()
+        for reader in self.readers:
+            reader.start()
+
+    def stop(self):
+        for reader in self.readers:
+            reader.running = False
+        for reader in self.readers:
+            reader.stop()
+
+    def stats(self):
+        # Per-port health and frame and byte rates since the previous call
+        now = time.monotonic()
+        elapsed = max(now - self.lastStatsClock, 1e-9)
+        self.lastStatsClock = now
+        result = []
+        for portIndex, reader in enumerate(self.readers):
+            frameCount, byteCount = reader.parser.frameCount, reader.byteCount
+            lastFrameCount, lastByteCount = self.lastCounts[portIndex]
+            self.lastCounts[portIndex] = (frameCount, byteCount)
+            if reader.error is not None:
+                health = 'error'
+            elif now - reader.lastFrameClock > self.stallTimeout:
+                health = 'stalled'
+            else:
+                health = 'ok'
+            result.append({'port': self.regions[portIndex][0], 'health': health,
+                           'framesPerSecond': (frameCount - lastFrameCount) / elapsed,
+                           'bytesPerSecond': (byteCount - lastByteCount) / elapsed,
+                           'frames': frameCount, 'malformedFrames': reader.parser.malformedFrameCount,
+                           'staleFrames': self.merger.staleFrameCount[portIndex], 'error': reader.error})
+        return result
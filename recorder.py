@@ -0,0 +1,173 @@
+import os
+import struct
+import threading
+import time
+import datetime
+
+import numpy as np
+
+from sessionFile import SessionSink, SessionReader
+from metrics import metrics
+from frameQueue import FrameQueue
+
+
+def formatTime(timestamp):
+    # Nanoseconds since the epoch -> local time text, the same format the Excel files used
+    return datetime.datetime.fromtimestamp(timestamp / 1e9).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+class CsvSink:
+    extension = 'csv'
+
+    def __init__(self, path, numBlock):
+        newFile = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', newline='')
+        if newFile:
+            self.file.write(','.join(['time'] + [f'block {_}' for _ in range(numBlock)]) + '\n')
+
+    def write(self, timestamps, frames):
+        self.file.write(''.join(f'{formatTime(timestamp)},{",".join(map(str, frame))}\n'
+                                for timestamp, frame in zip(timestamps, frames.tolist())))
+
+    def flush(self, sync):
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush(True)
+        self.file.close()
+
+
+class BinarySink:
+    # Header: magic, version, numBlock. Records: int64 timestamp in ns followed by numBlock float32 values
+    extension = 'bin'
+    magic = b'STCB'
+    header = struct.Struct('<4sHI')
+
+    def __init__(self, path, numBlock):
+        newFile = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.recordType = binaryRecordType(numBlock)
+        self.file = open(path, 'ab')
+        if newFile:
+            self.file.write(self.header.pack(self.magic, 1, numBlock))
+
+    def write(self, timestamps, frames):
+        records = np.empty(len(timestamps), dtype=self.recordType)
+        records['time'] = timestamps
+        records['data'] = frames
+        self.file.write(records.tobytes())
+
+    def flush(self, sync):
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush(True)
+        self.file.close()
+
+
+def binaryRecordType(numBlock):
+    return np.dtype([('time', '<i8'), ('data', '<f4', (numBlock,))])
+
+
+recordingSinks = {'csv': CsvSink, 'binary': BinarySink, 'session': SessionSink}
+
+
+def readRecording(path):
+    # Returns (timestamps in ns, frames) of a file written by CsvSink, BinarySink or SessionSink
+    if path.rstrip('/\\').endswith(SessionSink.extension):
+        session = SessionReader(path)
+        timestamps, frames = session.read(0, len(session))
+        return np.array(timestamps), frames.astype(np.float64)
+
+    if path.endswith(CsvSink.extension):
+        with open(path) as f:
+            f.readline()
+            rows = [line.rstrip('\n').split(',', 1) for line in f if line.strip()]
+        timestamps = np.array([int(datetime.datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S.%f').timestamp() * 1e9)
+                               for row in rows], dtype=np.int64)
+        frames = np.array([row[1].split(',') for row in rows], dtype=np.float64)
+        return timestamps, frames
+
+    with open(path, 'rb') as f:
+        magic, version, numBlock = BinarySink.header.unpack(f.read(BinarySink.header.size))
+        if magic != BinarySink.magic:
+            raise ValueError(f'{path} is not a recording')
+        records = np.fromfile(f, dtype=binaryRecordType(numBlock))
+    return records['time'], records['data'].astype(np.float64)
+
+
+class Recorder:
+    # Frames are queued by the reader and written by one thread. What happens when the disk falls behind by
+    # queueLength frames is up to policy (see FrameQueue): by default the oldest frames are dropped so a slow disk
+    # never blocks reading. Files are only appended to, flushed after every batch and fsynced at most every
+    # syncInterval seconds. A sink that fails stops the recording: the error is kept in error and later frames
+    # are dropped right away, the reader and the display go on.
+    def __init__(self, sinks, syncInterval=1.0, queueLength=10000, policy='dropOldest'):
+        self.sinks = sinks
+        self.syncInterval = syncInterval
+        self.queue = FrameQueue(queueLength, policy)
+        self.writtenFrameCount = 0
+        # Frames taken from the queue but not flushed yet
+        self.writingFrameCount = 0
+        self.failedFrameCount = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name='Recorder', daemon=True)
+        self.stopping = False
+
+    def start(self):
+        self.thread.start()
+
+    @property
+    def droppedFrameCount(self):
+        return self.queue.droppedCount + self.queue.coalescedCount + self.failedFrameCount
+
+    def put(self, timestamp, frame):
+        if self.error is not None:
+            self.failedFrameCount += 1
+            return
+        self.queue.put((timestamp, frame))
+
+    def stop(self):
+        self.stopping = True
+        if self.thread.is_alive():
+            self.thread.join()
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                if self.error is None:
+                    self.error = str(e)
+                    print(f'Recorder error:\n{str(e)}')
+
+    def run(self):
+        try:
+            self.writeBatches()
+        except Exception as e:
+            self.error = str(e)
+            print(f'Recorder error:\n{str(e)}')
+            self.failedFrameCount += len(self.queue) + self.writingFrameCount
+            self.writingFrameCount = 0
+            self.queue.clear()
+
+    def writeBatches(self):
+        lastSync = time.monotonic()
+        while not self.stopping or len(self.queue):
+            batch = self.queue.getBatch(timeout=0.1)
+            if not batch:
+                continue
+            self.writingFrameCount = len(batch)
+            timestamps = [timestamp for timestamp, _ in batch]
+            frames = np.array([frame for _, frame in batch])
+            sync = time.monotonic() - lastSync >= self.syncInterval
+            flushStart = time.perf_counter()
+            for sink in self.sinks:
+                sink.write(timestamps, frames)
+                sink.flush(sync)
+            metrics.observe('recordFlushSeconds', time.perf_counter() - flushStart)
+            if sync:
+                lastSync = time.monotonic()
+            self.writtenFrameCount += len(batch)
+            self.writingFrameCount = 0
@@ -0,0 +1,128 @@
+import os
+import argparse
+import configparser
+
+import numpy as np
+
+from multiPort import regionIndex
+from recorder import CsvSink, readRecording
+from sessionFile import SessionSink, SessionReader
+
+roiAggregates = ['sum', 'mean', 'max', 'centroidRow', 'centroidColumn']
+
+
+def parseRois(text):
+    # 'name row column rows columns [+ row column rows columns ...]; ...' -> [(name, [(row, column, rows, columns),
+    # ...]), ...], an ROI is the union of its rectangles
+    rois = []
+    for entry in text.split(';'):
+        if not entry.strip():
+            continue
+        name, _, rectangles = entry.strip().partition(' ')
+        fields = [_.split() for _ in rectangles.split('+')]
+        if any(len(_) != 4 for _ in fields):
+            raise ValueError(f'ROI "{entry.strip()}" is not "name row column rows columns [+ row column rows columns]"')
+        if name in [_[0] for _ in rois]:
+            raise ValueError(f'ROI {name} is defined twice')
+        rois.append((name, [tuple(int(_) for _ in rectangle) for rectangle in fields]))
+    return rois
+
+
+def formatRois(rois):
+    return '; '.join(f'{name} ' + ' + '.join(' '.join(str(_) for _ in rectangle) for rectangle in rectangles)
+                     for name, rectangles in rois)
+
+
+class RoiAggregator:
+    # Aggregates of every ROI for a batch of frames. The ROI masks, and the masks weighted by the row and column
+    # of each cell, are stacked into one numBlock x (3 x ROIs) matrix, so sums and centroid moments of all ROIs
+    # come out of a single product with it. max is not linear, it is one maximum.reduceat over the cells of all
+    # ROIs laid end to end
+    def __init__(self, rois, blockRow, blockColumn):
+        self.names = [name for name, _ in rois]
+        numBlock = blockRow * blockColumn
+        masks = np.zeros((len(rois), numBlock))
+        for i, (name, rectangles) in enumerate(rois):
+            for rectangle in rectangles:
+                masks[i, regionIndex((name,) + rectangle, blockRow, blockColumn)] = 1
+        row, column = np.divmod(np.arange(numBlock), blockColumn)
+        self.matrix = np.vstack([masks, masks * row, masks * column]).T
+        self.cellCount = masks.sum(axis=1)
+        cells = [np.flatnonzero(_) for _ in masks]
+        self.cells = np.concatenate(cells) if cells else np.zeros(0, dtype=int)
+        self.offsets = np.cumsum([0] + [len(_) for _ in cells[:-1]])
+
+    def columns(self):
+        # Names of the flattened aggregates, ROI by ROI
+        return [f'{name} {aggregate}' for name in self.names for aggregate in roiAggregates]
+
+    def aggregate(self, frames):
+        # (frames x numBlock) or one frame -> (frames x ROIs x roiAggregates). Centroids are weighted by the
+        # values, NaN when an ROI sums to 0
+        frames = np.atleast_2d(np.asarray(frames, dtype=np.float64))
+        count = len(self.names)
+        if not count:
+            return np.zeros((len(frames), 0, len(roiAggregates)))
+        products = frames @ self.matrix
+        total = products[:, :count]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.stack([total, total / self.cellCount,
+                             np.maximum.reduceat(frames[:, self.cells], self.offsets, axis=1),
+                             products[:, count:2 * count] / total, products[:, 2 * count:] / total], axis=2)
+
+
+class RoiSink(CsvSink):
+    # ROI aggregates of every recorded frame, a CSV with one column per ROI and aggregate beside the recording.
+    # The Recorder hands over whole batches, so it is one product per batch
+    extension = 'roi.csv'
+
+    def __init__(self, path, aggregator):
+        self.aggregator = aggregator
+        newFile = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', newline='')
+        if newFile:
+            self.file.write(','.join(['time'] + aggregator.columns()) + '\n')
+
+    def write(self, timestamps, frames):
+        super().write(timestamps, self.aggregator.aggregate(frames).reshape(len(timestamps), -1))
+
+
+if __name__ == '__main__':
+    # ROI series of a recording made before the ROIs were set up, or with other ROIs
+    parser = argparse.ArgumentParser(description='Write the ROI aggregates of a recording as CSV')
+    parser.add_argument('recording')
+    parser.add_argument('--config', default='config.ini', help='ROIs and grid size are read from [ROI] and [Display]')
+    parser.add_argument('--rois', help='ROIs to use instead of the ones in the config')
+    parser.add_argument('--output', help='defaults to the recording name with .roi.csv')
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    rois = parseRois(args.rois if args.rois is not None else config.get('ROI', 'regions', fallback=''))
+    if not rois:
+        parser.error('No ROIs, set them in [ROI] regions or with --rois')
+    blockRow = config.getint('Display', 'blockRow', fallback=1)
+    blockColumn = config.getint('Display', 'blockColumn', fallback=4)
+    path = args.recording.rstrip('/\\')
+    session = None
+    if path.endswith(SessionSink.extension):
+        # Sessions know their grid, and can be far bigger than memory: they are aggregated a chunk at a time
+        session = SessionReader(path)
+        blockRow = session.header.get('blockRow', blockRow)
+        blockColumn = session.header.get('blockColumn', blockColumn)
+    else:
+        timestamps, frames = readRecording(path)
+        if frames.shape[1] != blockRow * blockColumn:
+            parser.error(f'The recording has {frames.shape[1]} blocks, the {blockRow} x {blockColumn} grid of '
+                         f'{args.config} has {blockRow * blockColumn}')
+    aggregator = RoiAggregator(rois, blockRow, blockColumn)
+    output = args.output or os.path.splitext(path)[0] + '.' + RoiSink.extension
+    sink = RoiSink(output, aggregator)
+    if session is not None:
+        for start in range(0, len(session), 10000):
+            timestamps, frames = session.read(start, min(start + 10000, len(session)))
+            sink.write(np.asarray(timestamps).tolist(), frames)
+    else:
+        sink.write(timestamps.tolist(), frames)
+    sink.close()
+    print(f'{len(aggregator.columns())} ROI series written to {output}')
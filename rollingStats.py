@@ -0,0 +1,83 @@
+import threading
+
+import numpy as np
+
+layerList = ['raw', 'mean', 'std', 'min', 'max', 'ema', 'delta', 'peak']
+
+
+class RollingStats:
+    # Derived layers of the whole frame, updated once per frame with a few vector operations. Running sums give
+    # the rolling mean and std, min and max are only reduced over the window when a layer is asked for, which
+    # happens at display rate rather than frame rate.
+    # Sums are rebuilt from the window every window frames so rounding errors do not pile up
+    def __init__(self, numBlock, window=100, alpha=0.1):
+        self.numBlock = numBlock
+        self.window = window
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.reset()
+        self.baseline = None
+
+    def reset(self):
+        self.frames = np.zeros((self.window, self.numBlock))
+        self.sum = np.zeros(self.numBlock)
+        self.sumSquares = np.zeros(self.numBlock)
+        self.ema = None
+        self.peak = None
+        self.latest = np.full(self.numBlock, np.nan)
+        self.count = 0
+
+    def update(self, frame):
+        frame = np.asarray(frame, dtype=np.float64)
+        with self.lock:
+            row = self.count % self.window
+            if self.count >= self.window:
+                oldest = self.frames[row]
+                self.sum -= oldest
+                self.sumSquares -= oldest * oldest
+            self.frames[row] = frame
+            self.count += 1
+            if self.count % self.window == 0:
+                self.sum = self.frames.sum(axis=0)
+                self.sumSquares = np.square(self.frames).sum(axis=0)
+            else:
+                self.sum += frame
+                self.sumSquares += frame * frame
+
+            if self.ema is None:
+                self.ema = frame.copy()
+                self.peak = frame.copy()
+            else:
+                self.ema += self.alpha * (frame - self.ema)
+                np.fmax(self.peak, frame, out=self.peak)
+            self.latest = frame
+
+    def captureBaseline(self):
+        with self.lock:
+            self.baseline = self.latest.copy()
+
+    def resetPeak(self):
+        with self.lock:
+            self.peak = None if self.ema is None else self.latest.copy()
+
+    def layer(self, name):
+        with self.lock:
+            if name == 'raw' or self.count == 0:
+                return self.latest.copy()
+            n = min(self.count, self.window)
+            if name == 'mean':
+                return self.sum / n
+            if name == 'std':
+                mean = self.sum / n
+                return np.sqrt(np.maximum(self.sumSquares / n - mean * mean, 0))
+            if name == 'min':
+                return self.frames[:n].min(axis=0)
+            if name == 'max':
+                return self.frames[:n].max(axis=0)
+            if name == 'ema':
+                return self.ema.copy()
+            if name == 'delta':
+                return self.latest - (self.baseline if self.baseline is not None else self.latest)
+            if name == 'peak':
+                return self.peak.copy()
+            raise ValueError(f'Unknown layer {name}')
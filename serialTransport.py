@@ -0,0 +1,75 @@
+import serial
+
+# Port settings live in [Serial] for every port and in [Serial:<port>] for the keys one port overrides.
+# rx_buffer_size is the OS receive buffer asked for when the port is opened, 0 keeps the driver default.
+serialDefaults = {'baud_rate': 115200, 'byte_size': 8, 'parity': 'N', 'stop_bits': 1.0, 'timeout': 0.1,
+                  'rx_buffer_size': 0}
+serialTypes = {'baud_rate': int, 'byte_size': int, 'parity': str, 'stop_bits': float, 'timeout': float,
+               'rx_buffer_size': int}
+baudRateList = [9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600, 1000000, 1500000, 2000000, 3000000]
+byteSizeList = [5, 6, 7, 8]
+parityList = ['N', 'E', 'O', 'M', 'S']
+stopBitsList = [1.0, 1.5, 2.0]
+serialSectionPrefix = 'Serial:'
+
+
+def loadSerialSettings(config):
+    # {'': settings of every port, port: overridden keys, ...}
+    settings = {'': dict(serialDefaults)}
+    for section in config.sections():
+        if section == 'Serial':
+            port = ''
+        elif section.startswith(serialSectionPrefix):
+            port = section[len(serialSectionPrefix):]
+            settings[port] = {}
+        else:
+            continue
+        for key, value in config.items(section):
+            if key in serialTypes:
+                settings[port][key] = serialTypes[key](value)
+    return settings
+
+
+def saveSerialSettings(config, settings):
+    for section in config.sections():
+        if section.startswith(serialSectionPrefix):
+            config.remove_section(section)
+    for port, values in settings.items():
+        section = serialSectionPrefix + port if port else 'Serial'
+        if not config.has_section(section):
+            config.add_section(section)
+        for key, value in values.items():
+            config.set(section, key, str(value))
+
+
+def portSettings(settings, port):
+    return dict(settings[''], **settings.get(port, {}))
+
+
+def pyserialSettings(values):
+    # Keys of serial.Serial.apply_settings()
+    stopBits = values['stop_bits']
+    return {'baudrate': values['baud_rate'], 'bytesize': values['byte_size'], 'parity': values['parity'],
+            'stopbits': int(stopBits) if stopBits in (1.0, 2.0) else stopBits, 'timeout': values['timeout']}
+
+
+def createSerial(port, values):
+    # Configured but closed, the port is opened by openSerial()
+    currentSerial = serial.Serial()
+    currentSerial.port = port
+    currentSerial.apply_settings(pyserialSettings(values))
+    return currentSerial
+
+
+def openSerial(currentSerial, values):
+    currentSerial.open()
+    if values['rx_buffer_size'] and hasattr(currentSerial, 'set_buffer_size'):
+        # Only the Windows driver takes a buffer size, elsewhere the kernel buffer is fixed
+        currentSerial.set_buffer_size(rx_size=values['rx_buffer_size'])
+
+
+def lineRate(values):
+    # Bytes per second the line can carry: every byte has a start bit, data bits, an optional parity bit and
+    # the stop bits
+    bits = 1 + values['byte_size'] + (values['parity'] != 'N') + values['stop_bits']
+    return values['baud_rate'] / bits
@@ -0,0 +1,104 @@
+import os
+import json
+
+import numpy as np
+
+# A session is a directory of append-only columns that can be memory-mapped while they grow:
+#   header.json  grid shape, colour settings, dtype and index interval
+#   time.i8      int64 timestamp in ns of every frame
+#   frames.dat   frames x numBlock values of the header dtype, row-major
+#   index.i8     (timestamp, frame number) pairs, one every indexInterval frames
+sessionVersion = 1
+indexInterval = 1024
+
+
+class SessionSink:
+    extension = 'session'
+
+    def __init__(self, path, numBlock, header=None, dtype='<f4'):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        headerPath = os.path.join(path, 'header.json')
+        if os.path.exists(headerPath):
+            with open(headerPath) as f:
+                self.header = json.load(f)
+            if self.header['numBlock'] != numBlock:
+                raise ValueError(f'{path} holds {self.header["numBlock"]} blocks, not {numBlock}')
+        else:
+            self.header = dict(header or {})
+            self.header.update({'version': sessionVersion, 'numBlock': numBlock, 'dtype': dtype,
+                                'indexInterval': indexInterval})
+            with open(headerPath, 'w') as f:
+                json.dump(self.header, f, indent=4)
+
+        self.dtype = np.dtype(self.header['dtype'])
+        self.indexInterval = self.header['indexInterval']
+        self.timeFile = open(os.path.join(path, 'time.i8'), 'ab')
+        self.framesFile = open(os.path.join(path, 'frames.dat'), 'ab')
+        self.indexFile = open(os.path.join(path, 'index.i8'), 'ab')
+        self.frameCount = self.timeFile.tell() // 8
+
+    def write(self, timestamps, frames):
+        # Frames are appended first so a reader never sees a timestamp without its frame
+        timestamps = np.asarray(timestamps, dtype='<i8')
+        self.framesFile.write(np.ascontiguousarray(frames, dtype=self.dtype).tobytes())
+        self.timeFile.write(timestamps.tobytes())
+
+        # Frame numbers in this chunk that start a new index interval
+        first = -self.frameCount % self.indexInterval
+        indexed = np.arange(first, len(timestamps), self.indexInterval)
+        if len(indexed):
+            entries = np.column_stack((timestamps[indexed], indexed + self.frameCount)).astype('<i8')
+            self.indexFile.write(entries.tobytes())
+        self.frameCount += len(timestamps)
+
+    def flush(self, sync):
+        for f in (self.framesFile, self.timeFile, self.indexFile):
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+
+    def close(self):
+        self.flush(True)
+        for f in (self.framesFile, self.timeFile, self.indexFile):
+            f.close()
+
+
+def mapColumn(path, dtype, shape):
+    # np.memmap refuses empty files
+    if os.path.getsize(path) == 0 or shape[0] == 0:
+        return np.empty((0,) + shape[1:], dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+
+class SessionReader:
+    # Random access to a session without loading it, call refresh() to see frames appended since opening
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'header.json')) as f:
+            self.header = json.load(f)
+        self.numBlock = self.header['numBlock']
+        self.dtype = np.dtype(self.header['dtype'])
+        self.refresh()
+
+    def refresh(self):
+        timeCount = os.path.getsize(os.path.join(self.path, 'time.i8')) // 8
+        frameCount = os.path.getsize(os.path.join(self.path, 'frames.dat')) // (self.numBlock * self.dtype.itemsize)
+        self.frameCount = min(timeCount, frameCount)
+        self.time = mapColumn(os.path.join(self.path, 'time.i8'), '<i8', (self.frameCount,))
+        self.frames = mapColumn(os.path.join(self.path, 'frames.dat'), self.dtype, (self.frameCount, self.numBlock))
+        self.index = np.fromfile(os.path.join(self.path, 'index.i8'), dtype='<i8').reshape(-1, 2)
+        self.index = self.index[self.index[:, 1] < self.frameCount]
+
+    def __len__(self):
+        return self.frameCount
+
+    def seek(self, timestamp):
+        # Number of the first frame at or after timestamp, only one index interval of time.i8 is touched
+        position = np.searchsorted(self.index[:, 0], timestamp)
+        start = self.index[position - 1, 1] if position > 0 else 0
+        stop = self.index[position, 1] if position < len(self.index) else self.frameCount
+        return int(start + np.searchsorted(self.time[start:stop], timestamp))
+
+    def read(self, start, stop):
+        return self.time[start:stop], self.frames[start:stop]
@@ -0,0 +1,162 @@
+import time
+
+import numpy as np
+
+from frameParser import encodeBinaryFrame
+
+simulatorPort = 'simulator'
+waveformList = ['sine', 'ramp', 'square', 'random', 'constant']
+
+
+class SimulatedSerial:
+    # In-process stand-in for serial.Serial that produces frames in the configured format at frameRate.
+    # Frames are generated lazily from the elapsed time when the reader asks for data, and bytes beyond
+    # bufferSize are lost like in a full OS receive buffer.
+    def __init__(self, frameRate=100, waveform='sine', noise=0.0, corruption=0.0, minData=0, maxData=30,
+                 bufferSize=65536, seed=None):
+        self.port = simulatorPort
+        self.frameRate = frameRate
+        self.waveform = waveform
+        self.noise = noise
+        self.corruption = corruption
+        self.minData = minData
+        self.maxData = maxData
+        self.bufferSize = bufferSize
+        self.random = np.random.default_rng(seed)
+        self.timeout = None
+        self.is_open = False
+
+        self.blockRow = 1
+        self.blockColumn = 4
+        self.protocol = 'ascii'
+        self.binarySampleType = 'int16'
+        self.separationBetweenRows = ord('-')
+        self.separationBetweenNumbers = ord(',')
+
+        self.pending = bytearray()
+        self.frameCount = 0
+        self.corruptedFrameCount = 0
+        self.overflowByteCount = 0
+        self.startClock = 0
+
+    def configure(self, blockRow, blockColumn, protocol, binarySampleType, separationBetweenRows,
+                  separationBetweenNumbers):
+        self.blockRow = blockRow
+        self.blockColumn = blockColumn
+        self.protocol = protocol
+        self.binarySampleType = binarySampleType
+        self.separationBetweenRows = separationBetweenRows
+        self.separationBetweenNumbers = separationBetweenNumbers
+
+    def open(self):
+        self.is_open = True
+        self.pending = bytearray()
+        self.frameCount = 0
+        self.startClock = time.perf_counter()
+
+    def close(self):
+        self.is_open = False
+
+    @property
+    def in_waiting(self):
+        self.generate()
+        return len(self.pending)
+
+    def read(self, size=1):
+        self.generate()
+        if not self.pending:
+            # Block like a real port until the next frame is due or the timeout runs out
+            deadline = time.perf_counter() + (self.timeout if self.timeout is not None else 1e9)
+            while not self.pending and self.is_open and time.perf_counter() < deadline:
+                due = self.startClock + (self.frameCount + 1) / self.frameRate
+                time.sleep(max(min(due, deadline) - time.perf_counter(), 0))
+                self.generate()
+        data = bytes(self.pending[:size])
+        del self.pending[:size]
+        return data
+
+    def readline(self):
+        line = bytearray()
+        while not line.endswith(b'\n'):
+            data = self.read(1)
+            if not data:
+                break
+            line += data
+        return bytes(line)
+
+    def write(self, data):
+        return len(data)
+
+    def generate(self):
+        if not self.is_open:
+            return
+        due = int((time.perf_counter() - self.startClock) * self.frameRate)
+        # After a long stall only the frames that could still fit in the buffer are generated
+        maxFrames = max(self.bufferSize // (self.blockRow * self.blockColumn * 2) + 1, 1)
+        if due - self.frameCount > maxFrames:
+            self.frameCount = due - maxFrames
+        while self.frameCount < due:
+            self.pending += self.encode(self.values(self.frameCount))
+            self.frameCount += 1
+        if len(self.pending) > self.bufferSize:
+            self.overflowByteCount += len(self.pending) - self.bufferSize
+            del self.pending[:len(self.pending) - self.bufferSize]
+
+    def values(self, frameNumber):
+        numBlock = self.blockRow * self.blockColumn
+        t = frameNumber / self.frameRate
+        phase = np.arange(numBlock) / numBlock
+        middle = (self.maxData + self.minData) / 2
+        amplitude = (self.maxData - self.minData) / 2
+        if self.waveform == 'sine':
+            values = middle + amplitude * np.sin(2 * np.pi * (0.5 * t + phase))
+        elif self.waveform == 'ramp':
+            values = self.minData + 2 * amplitude * ((0.5 * t + phase) % 1)
+        elif self.waveform == 'square':
+            values = middle + amplitude * np.sign(np.sin(2 * np.pi * (0.5 * t + phase)))
+        elif self.waveform == 'random':
+            values = self.random.uniform(self.minData, self.maxData, numBlock)
+        else:
+            values = np.full(numBlock, middle)
+        if self.noise:
+            values = values + self.random.normal(0, self.noise * amplitude, numBlock)
+        return values
+
+    def encode(self, values):
+        corrupt = self.corruption and self.random.random() < self.corruption
+        if corrupt:
+            self.corruptedFrameCount += 1
+
+        if self.protocol == 'binary':
+            data = encodeBinaryFrame(values, self.binarySampleType)
+            if corrupt:
+                if self.random.random() < 0.5:
+                    # Truncated frame
+                    data = data[:self.random.integers(1, len(data))]
+                else:
+                    # Flipped payload byte, caught by the CRC
+                    position = self.random.integers(4, len(data) - 4)
+                    data = data[:position] + bytes([data[position] ^ 0xff]) + data[position + 1:]
+            return data
+
+        separation = chr(self.separationBetweenNumbers)
+        rows = [separation.join(f'{_:.2f}' for _ in values[i * self.blockColumn:(i + 1) * self.blockColumn])
+                for i in range(self.blockRow)]
+        if self.blockRow != 1:
+            rows.append(chr(self.separationBetweenRows))
+        if corrupt:
+            kind = self.random.integers(3)
+            index = self.random.integers(len(rows))
+            if kind == 0:
+                # Truncated row
+                rows[index] = rows[index][:self.random.integers(len(rows[index]))]
+            elif kind == 1:
+                # Stray blank line
+                rows.insert(index, '')
+            elif self.blockRow != 1:
+                # Missing row separator
+                rows.pop()
+            else:
+                # Missing number separator
+                rows[index] = rows[index].replace(separation, '', 1)
+        return ''.join(_ + '\r\n' for _ in rows).encode('utf-8')